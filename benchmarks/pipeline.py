@@ -0,0 +1,231 @@
+##
+## Pipeline benchmark suite for generatr
+## Generates synthetic XML configs varying locus count, regions per locus, range width and flank
+## length, and times every stage of the pipeline on each: config parse/validate (ConfigReader),
+## locus collection (loci_collector), haplotype generation (generate_loci_reference) and writing
+## (write_output). Each scenario runs in a fresh interpreter, so peak RSS is its own.
+## Results are written as JSON tagged with the commit, and can be compared against an earlier run:
+##   python benchmarks/pipeline.py [--quick] [-n 3] [--json results.json] [--compare baseline.json]
+
+##
+## Generic imports
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+##
+## Scenarios: a baseline, then one dimension varied at a time from it
+## (loci per config, repeat regions per locus, counts per region range, flank length)
+BASELINE = {'loci': 10, 'regions': 2, 'width': 30, 'flank': 100}
+DIMENSIONS = {'loci': (1, 10, 100),
+			  'regions': (1, 2, 3),
+			  'width': (10, 30, 90),
+			  'flank': (10, 100, 1000)}
+QUICK_DIVISOR = 3
+UNITS = ('CAG', 'CCG', 'CTG', 'GGC', 'AT', 'A')
+STAGES = ('parse', 'collect', 'generate', 'write')
+REGRESSION_THRESHOLD = 0.10
+NOISE_FLOOR = 0.005
+
+def scenarios(quick=False):
+
+	"""
+	Name -> parameters of every scenario; --quick shrinks range widths and locus counts
+	"""
+
+	matrix = {'baseline': dict(BASELINE)}
+	for dimension, values in DIMENSIONS.items():
+		for value in values:
+			if value == BASELINE[dimension]:
+				continue
+			parameters = dict(BASELINE)
+			parameters[dimension] = value
+			matrix['{}={}'.format(dimension, value)] = parameters
+	if quick:
+		for parameters in matrix.values():
+			parameters['width'] = max(2, parameters['width'] // QUICK_DIVISOR)
+			parameters['loci'] = max(1, parameters['loci'] // QUICK_DIVISOR)
+	return matrix
+
+def synthetic_config(parameters, seed=0):
+
+	"""
+	A deterministic XML config for the given parameters
+	"""
+
+	rng = random.Random(seed)
+	bases = lambda length: ''.join(rng.choice('ACGT') for _ in range(length))
+	lines = ['<?xml version="1.0"?>', '<data>']
+	for locus in range(parameters['loci']):
+		lines.append('    <loci label="synthetic_{}">'.format(locus))
+		lines.append('        <input type="fiveprime" flank="{}"/>'.format(bases(parameters['flank'])))
+		for order in range(1, parameters['regions'] + 1):
+			unit = UNITS[(locus + order) % len(UNITS)]
+			start = rng.randint(1, 10)
+			lines.append('        <input type="repeat_region" order="{}" unit="{}" start="{}" end="{}"/>'.format(order, unit, start, start + parameters['width'] - 1))
+			if order < parameters['regions']:
+				lines.append('        <input type="intervening" sequence="{}" prior="{}"/>'.format(bases(12), order))
+		lines.append('        <input type="threeprime" flank="{}"/>'.format(bases(parameters['flank'])))
+		lines.append('    </loci>')
+	lines.append('</data>')
+	return '\n'.join(lines) + '\n'
+
+def run_scenario(parameters, repeats):
+
+	"""
+	Times each pipeline stage (best of repeats) on one scenario, in this process
+	"""
+
+	from generatr.api import Generator
+	from generatr.planner import peak_rss
+	from generatr.dtdvalidate.validation import ConfigReader
+
+	generator = Generator()
+	timings = dict((stage, []) for stage in STAGES)
+	with tempfile.TemporaryDirectory() as workspace:
+		config_path = os.path.join(workspace, 'synthetic.xml')
+		output_path = os.path.join(workspace, 'synthetic.fa')
+		with open(config_path, 'w') as config_file:
+			config_file.write(synthetic_config(parameters))
+
+		for _ in range(repeats):
+			started = time.perf_counter()
+			raw_loci = list(ConfigReader(generator.package_configDTD, config_path, stream=True).iter_loci())
+			timings['parse'].append(time.perf_counter() - started)
+
+			started = time.perf_counter()
+			loci = [generator.loci_collector(raw_locus) for raw_locus in raw_loci]
+			timings['collect'].append(time.perf_counter() - started)
+
+			records = 0
+			output_bytes = 0
+			started = time.perf_counter()
+			for locus in loci:
+				for label, sequence in generator.generate_loci_reference(locus):
+					records += 1
+					output_bytes += len(label) + len(sequence) + 3
+			timings['generate'].append(time.perf_counter() - started)
+
+			started = time.perf_counter()
+			written = generator.write_output(loci, output_path)
+			timings['write'].append(time.perf_counter() - started)
+
+	result = {'parameters': parameters, 'records': written['records'], 'bytes': written['bytes'], 'stages': {}}
+	for stage in STAGES:
+		seconds = min(timings[stage])
+		result['stages'][stage] = {'seconds': seconds}
+		if stage in ('generate', 'write'):
+			result['stages'][stage]['records_per_second'] = records / seconds if seconds else 0.0
+			result['stages'][stage]['bytes_per_second'] = output_bytes / seconds if seconds else 0.0
+	result['peak_rss'] = peak_rss()
+	return result
+
+def git_revision():
+
+	try:
+		commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY, capture_output=True, text=True, check=True).stdout.strip()
+		dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPOSITORY, capture_output=True, text=True, check=True).stdout.strip())
+	except (OSError, subprocess.CalledProcessError):
+		return None
+	return commit + ('-dirty' if dirty else '')
+
+def compare(results, baseline, threshold):
+
+	"""
+	Prints per stage slowdowns against a baseline results file; returns the regressions found
+	Stages faster than NOISE_FLOOR seconds in both runs are reported but never flagged
+	"""
+
+	regressions = []
+	print('\n{:<18}{:<10}{:>12}{:>12}{:>9}'.format('scenario', 'stage', 'baseline', 'current', 'ratio'))
+	for name, result in sorted(results['scenarios'].items()):
+		previous = baseline['scenarios'].get(name)
+		if previous is None or previous['parameters'] != result['parameters']:
+			continue
+		measures = [(stage, previous['stages'][stage]['seconds'], result['stages'][stage]['seconds']) for stage in STAGES]
+		if previous['peak_rss'] is not None and result['peak_rss'] is not None:
+			measures.append(('peak_rss', previous['peak_rss'], result['peak_rss']))
+		for measure, before, after in measures:
+			ratio = after / before if before else 1.0
+			flag = ''
+			if ratio > 1.0 + threshold and (measure == 'peak_rss' or max(before, after) >= NOISE_FLOOR):
+				flag = '  REGRESSION'
+				regressions.append((name, measure, ratio))
+			print('{:<18}{:<10}{:>12.4g}{:>12.4g}{:>9.2f}{}'.format(name, measure, before, after, ratio, flag))
+	for startup, before in baseline.get('startup', {}).items():
+		after = results['startup'].get(startup)
+		if after is not None and before and after / before > 1.0 + threshold:
+			regressions.append(('startup', startup, after / before))
+	return regressions
+
+def main():
+
+	parser = argparse.ArgumentParser(description='generatr pipeline benchmark suite')
+	parser.add_argument('-n','--repeats',help='Runs per stage; the best is reported (default 3).',type=int,default=3)
+	parser.add_argument('-q','--quick',help='Smaller scenarios, for a fast sanity check.',action='store_true')
+	parser.add_argument('-s','--scenario',help='Only run scenarios whose name contains this.',default='')
+	parser.add_argument('--json',help='Write the results to this JSON file.')
+	parser.add_argument('--compare',help='Compare against an earlier results JSON; exits non-zero on any regression.')
+	parser.add_argument('--threshold',help='Slowdown reported as a regression (default 0.10, i.e. 10%%).',type=float,default=REGRESSION_THRESHOLD)
+	parser.add_argument('--worker',help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	##
+	## Worker mode: one scenario, in a fresh interpreter, result as JSON on stdout
+	if args.worker:
+		print(json.dumps(run_scenario(json.loads(args.worker), args.repeats)))
+		return
+
+	results = {'commit': git_revision(), 'python': sys.version.split()[0], 'platform': platform.platform(),
+			   'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'quick': args.quick, 'repeats': args.repeats, 'scenarios': {}}
+
+	##
+	## Startup: import time of a fresh interpreter (see startup.py for the full set)
+	from startup import time_command
+	environment = dict(os.environ)
+	environment['PYTHONPATH'] = REPOSITORY + os.pathsep + environment.get('PYTHONPATH', '')
+	interpreter = time_command([sys.executable, '-c', 'pass'], max(5, args.repeats), environment)['median']
+	imported = time_command([sys.executable, '-c', 'import generatr'], max(5, args.repeats), environment)['median']
+	results['startup'] = {'interpreter': interpreter, 'import generatr': imported}
+	print('{:<18}{:.1f} ms (interpreter {:.1f} ms)'.format('import generatr', imported*1000, interpreter*1000))
+
+	print('{:<18}{:>9}{:>11}{:>9}{:>9}{:>10}{:>10}{:>13}{:>13}{:>10}'.format('scenario', 'records', 'bytes', 'parse', 'collect',
+		  'generate', 'write', 'write rec/s', 'write MiB/s', 'peak RSS'))
+	for name, parameters in scenarios(args.quick).items():
+		if args.scenario not in name:
+			continue
+		worker = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', json.dumps(parameters), '-n', str(args.repeats)],
+								env=environment, capture_output=True, text=True, check=True)
+		result = json.loads(worker.stdout)
+		results['scenarios'][name] = result
+		stages = result['stages']
+		print('{:<18}{:>9}{:>11}{:>8.3f}s{:>8.3f}s{:>9.3f}s{:>9.3f}s{:>13.0f}{:>13.1f}{:>8.1f}MB'.format(name, result['records'], result['bytes'],
+			  stages['parse']['seconds'], stages['collect']['seconds'], stages['generate']['seconds'], stages['write']['seconds'],
+			  stages['write']['records_per_second'], stages['write']['bytes_per_second'] / 1024**2, (result['peak_rss'] or 0) / 1024**2))
+
+	if args.json:
+		with open(args.json, 'w') as json_file:
+			json.dump(results, json_file, indent=2, sort_keys=True)
+
+	if args.compare:
+		with open(args.compare, 'r') as baseline_file:
+			baseline = json.load(baseline_file)
+		print('\nBaseline {} vs current {}'.format(baseline.get('commit'), results['commit']))
+		regressions = compare(results, baseline, args.threshold)
+		for name, measure, ratio in regressions:
+			print('Regression: {} {} is {:.0%} slower/larger'.format(name, measure, ratio - 1.0))
+		if regressions:
+			sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,75 @@
+##
+## Startup time benchmark for generatr
+## Times fresh interpreters (median of N runs) for: importing the package, printing --help,
+## and generating a tiny single locus reference with and without validation.
+## Run from a checkout:  python benchmarks/startup.py [-n 20] [--json results.json]
+
+##
+## Generic imports
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TINY_CONFIG = '''<?xml version="1.0"?>
+<data>
+    <loci label="tiny">
+        <input type="fiveprime" flank="GCGACCCTGGAAAAGCTG"/>
+        <input type="repeat_region" order="1" unit="CAG" start="10" end="12"/>
+        <input type="threeprime" flank="CCTCCTCAGCTTCC"/>
+    </loci>
+</data>
+'''
+
+def time_command(command, repeats, environment):
+
+	"""
+	Median and minimum wall clock seconds of a command, over repeats fresh processes
+	"""
+
+	timings = []
+	for _ in range(repeats):
+		started = time.perf_counter()
+		subprocess.run(command, env=environment, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+		timings.append(time.perf_counter() - started)
+	return {'median': statistics.median(timings), 'min': min(timings)}
+
+def main():
+
+	parser = argparse.ArgumentParser(description='generatr startup time benchmark')
+	parser.add_argument('-n','--repeats',help='Fresh interpreters per measurement (default 20).',type=int,default=20)
+	parser.add_argument('--json',help='Also write the results to this JSON file.')
+	args = parser.parse_args()
+
+	##
+	## Benchmark the working tree, not whichever generatr happens to be installed
+	environment = dict(os.environ)
+	environment['PYTHONPATH'] = REPOSITORY + os.pathsep + environment.get('PYTHONPATH', '')
+
+	with tempfile.TemporaryDirectory() as workspace:
+		config_path = os.path.join(workspace, 'tiny.xml')
+		with open(config_path, 'w') as config_file:
+			config_file.write(TINY_CONFIG)
+		output_path = os.path.join(workspace, 'tiny.fa')
+
+		measurements = [('interpreter', [sys.executable, '-c', 'pass']),
+						('import generatr', [sys.executable, '-c', 'import generatr']),
+						('generatr --help', [sys.executable, '-m', 'generatr', '--help']),
+						('tiny locus', [sys.executable, '-m', 'generatr', '-i', config_path, '-o', output_path]),
+						('tiny locus --no-validate', [sys.executable, '-m', 'generatr', '-n', '-i', config_path, '-o', output_path])]
+		results = {}
+		for name, command in measurements:
+			results[name] = time_command(command, args.repeats, environment)
+			print('{:<28}median {:8.1f} ms    min {:8.1f} ms'.format(name, results[name]['median']*1000, results[name]['min']*1000))
+
+	if args.json:
+		with open(args.json, 'w') as json_file:
+			json.dump({'python': sys.version.split()[0], 'repeats': args.repeats, 'results': results}, json_file, indent=2)
+
+if __name__ == '__main__':
+	main()
@@ -1,5 +1,10 @@
 from generatr import generatr
-__all__ = ['__init__.py',
-		   '__main__.py',
-		   'generatr.py',
-		   'validation.py']
\ No newline at end of file
+from generatr.api import Generator, generate, ConfigError
+from generatr.model import Locus, Region, Constraint
+__all__ = ['generatr',
+		   'Generator',
+		   'generate',
+		   'ConfigError',
+		   'Locus',
+		   'Region',
+		   'Constraint']
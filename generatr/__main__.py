@@ -1,2 +1,2 @@
-from generatr import main
+from generatr.generatr import main
 main()
\ No newline at end of file
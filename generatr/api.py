@@ -0,0 +1,321 @@
+##
+## Library API
+## Everything the CLI does, without argparse, logging setup or sys.exit; one Generator can be
+## re-used for any number of configs, sharing its (cached) DTD and options between them
+
+##
+## Generic imports
+import os
+from contextlib import nullcontext
+
+##
+## Subpackage/s??
+from .dtdvalidate.validation import ConfigReader, ConfigError
+from .model import Locus
+from .output import FastaWriter
+from .ordering import DEFAULT_ORDERING
+from .haplotypes import haplotype_records
+from .parallel import resolve_jobs, parallel_records
+from .shards import write_shards
+from .lookup import lookup_records
+from .cache import LocusCache, DEFAULT_CACHE_SIZE, locus_key
+from .planner import plan_loci, locus_plan
+
+def package_data(relative_path):
+
+	"""
+	Filesystem path of a file shipped inside the package (importlib.resources, not pkg_resources)
+	"""
+
+	try:
+		from importlib.resources import files
+	except ImportError:
+		return os.path.join(os.path.dirname(os.path.abspath(__file__)), relative_path)
+	return str(files('generatr').joinpath(relative_path))
+
+class Generator(object):
+
+	"""
+	Reusable reference generator.
+	config arguments may be a path to a config (XML, or a TSV/JSON/YAML locus table), a single model.Locus, or any iterable of
+	model.Locus objects; configuration problems raise ConfigError rather than exiting.
+	validate=False skips DTD/ruleset validation entirely, for trusted, pre-validated configs.
+	cache_dir enables the on-disk locus cache (see cache.LocusCache), bounded to cache_size bytes.
+	"""
+
+	def __init__(self, silent=False, ordering=DEFAULT_ORDERING, jobs=1, compress=False, index=False, validate=True,
+				 cache_dir=None, cache_size=DEFAULT_CACHE_SIZE):
+
+		##
+		## Package data; the DTD is compiled (on first use) once and shared by every config read
+		self.package_configDTD = package_data('dtdvalidate/xml_rules.dtd')
+		self.validate = validate
+
+		##
+		## Generation/output options
+		self.silent_flag = silent
+		self.ordering = ordering
+		self.jobs = resolve_jobs(jobs)
+		self.compress_flag = compress
+		self.index_flag = index
+		self.cache = LocusCache(cache_dir, cache_size) if cache_dir else None
+
+	@staticmethod
+	def loci_collector(raw_locus):
+
+		"""
+		Function to extract (now verified) information to pass to cartesian string generator
+		Assuming all information is now valid so no more checks are carried out
+		Returns a compact, immutable model.Locus; integers are parsed here, once
+		"""
+
+		return Locus.from_raw(raw_locus)
+
+	def loci(self, config):
+
+		"""
+		Yields model.Locus objects from config; XML is validated as it is streamed in
+		"""
+
+		if isinstance(config, Locus):
+			yield config
+		elif isinstance(config, (str, bytes, os.PathLike)):
+			config_reader = ConfigReader(self.package_configDTD, os.fsdecode(config), stream=True, validate=self.validate)
+			for raw_locus in config_reader.iter_loci():
+				try:
+					yield self.loci_collector(raw_locus)
+				except (KeyError, ValueError) as error:
+					raise ConfigError('Unusable locus "{0}" in {1}config {2}: {3!r}'.format(raw_locus.get('@label', ''),
+									  '' if self.validate else 'unvalidated ', config, error))
+		else:
+			for locus in config:
+				yield locus
+
+	def generate_loci_reference(self, locus):
+
+		"""
+		Generator which yields a (label, sequence) record for every haplotype of a locus
+		Nothing is accumulated here; the caller decides where each record goes
+		"""
+
+		return haplotype_records(locus, self.silent_flag, self.ordering)
+
+	def records(self, config):
+
+		"""
+		Yields (label, sequence) records for every haplotype of every locus in config
+		"""
+
+		for locus in self.loci(config):
+			for record in self.generate_loci_reference(locus):
+				yield record
+
+	def plan(self, config):
+
+		"""
+		Closed form sizes and predictions for config (see planner.plan_loci)
+		"""
+
+		return plan_loci(self.loci(config), self.silent_flag, self.ordering, self.jobs)
+
+	def lookup(self, config, key):
+
+		"""
+		The (label, sequence) record for key, without generating anything else; key is a haplotype
+		index (over the whole config), '<locus label>:<index>' or a haplotype label
+		Raises IndexError/KeyError (LookupError) if there is no such haplotype
+		"""
+
+		return lookup_records(self.loci(config), [key], self.silent_flag, self.ordering)[0]
+
+	def lookup_many(self, config, keys):
+
+		"""
+		Records for several keys (see lookup), in key order; config is read only once
+		"""
+
+		return lookup_records(self.loci(config), keys, self.silent_flag, self.ordering)
+
+	def write_output(self, config, output_path, shards=1, shard_by='records', metrics=None, journal=None):
+
+		"""
+		Generates config straight into output_path (atomically; see output.FastaWriter)
+		Returns the number of records and (uncompressed) bytes written
+		shards > 1 splits the output into that many shards balanced by shard_by (records, bytes
+		or whole loci), generated in parallel across jobs, plus a manifest; see shards.write_shards
+		metrics (a metrics.RunMetrics) is fed stage timings, per locus hooks and sampled progress;
+		the run is sized for progress and ETA without holding the config in memory (see expect_loci)
+		journal (a checkpoint.CheckpointJournal) checkpoints plain, unsharded output as it is written,
+		and resumes it from its last verified checkpoint if the journal was opened to resume
+		"""
+
+		if journal is not None and (shards > 1 or self.compress_flag or self.index_flag):
+			raise ValueError('Checkpointing is only available for plain, unsharded output (no compression, index or shards)')
+		stage = metrics.stage if metrics is not None else (lambda name: nullcontext())
+		watch = metrics.watch if metrics is not None else (lambda source: nullcontext())
+
+		loci = self.loci(config)
+		completed = False
+		try:
+			if metrics is not None:
+				with stage('plan'):
+					loci = self.expect_loci(config, loci, metrics)
+
+			##
+			## Shards are written by worker processes; progress advances as each one completes
+			if shards > 1:
+				shards_written = [0, 0]
+				def shard_written(records, size):
+					shards_written[0] += records
+					shards_written[1] += size
+				with stage('generate'), watch(lambda: tuple(shards_written)):
+					written = write_shards(loci, output_path, shards, shard_by, self.jobs, self.silent_flag,
+										   self.ordering, self.compress_flag, self.index_flag, shard_written)
+				completed = True
+				return written
+
+			with self.output_writer(output_path, journal) as writer:
+				if metrics is not None:
+					metrics.resume(writer.records_written, writer.bytes_written)
+				with stage('generate'), watch(lambda: (writer.records_written, writer.bytes_written)):
+					self.write_loci(writer, loci, metrics, journal)
+				with stage('finalise'):
+					writer.close()
+			completed = True
+			return {'records': writer.records_written, 'bytes': writer.bytes_written}
+		finally:
+			if journal is not None:
+				journal.close(completed)
+			if metrics is not None:
+				metrics.finish(completed)
+
+	def expect_loci(self, config, loci, metrics):
+
+		"""
+		Gives metrics the closed form totals of config, streaming: a config which can be read again
+		(a path, a Locus, a list..) is sized by a pass of its own; for a one-shot iterator of loci the
+		expected totals grow as each locus is handed over. Returns the loci to generate
+		"""
+
+		if isinstance(config, (str, bytes, os.PathLike, Locus)) or iter(config) is not config:
+			records = output_bytes = 0
+			for locus in self.loci(config):
+				size = locus_plan(locus, self.silent_flag, self.ordering)
+				records += size['haplotypes']
+				output_bytes += size['bytes']
+			metrics.expect(records, output_bytes)
+			return loci
+
+		def expected(loci):
+			metrics.expect(0, 0)
+			for locus in loci:
+				size = locus_plan(locus, self.silent_flag, self.ordering)
+				metrics.expect(metrics.expected_records + size['haplotypes'], metrics.expected_bytes + size['bytes'])
+				yield locus
+		return expected(loci)
+
+	def output_writer(self, output_path, journal=None):
+
+		##
+		## A checkpointed run's writer comes from its journal (possibly part way through the output)
+		if journal is not None:
+			return journal.writer()
+		return FastaWriter(output_path, self.compress_flag, self.index_flag)
+
+	def cache_key(self, locus):
+		return locus_key(locus, self.silent_flag, self.ordering)
+
+	def cached(self, locus):
+		return self.cache is not None and self.cache.contains(self.cache_key(locus))
+
+	def write_loci(self, writer, loci, metrics=None, journal=None):
+
+		"""
+		Streams loci into an open writer; across a process pool when jobs > 1
+		Parallel slices come back in order, and a locus is terminated after its final slice
+		With a cache, hits are spliced in without being generated, and misses are copied
+		into the cache as they are written (committed only once the locus is complete)
+		metrics, if given, is told as each locus starts and completes
+		journal, if given, is told the same and checkpoints the writer; a resumed journal skips the
+		loci already written and starts the next one from the position it had reached
+		"""
+
+		partial_start = 0
+		if journal is not None:
+			loci = journal.remaining(loci)
+			partial_start = journal.position
+		if self.jobs > 1:
+			blocks = parallel_records(loci, self.jobs, self.silent_flag, self.ordering, skip=self.cached if self.cache is not None else None,
+									  first_start=partial_start)
+		else:
+			blocks = self.locus_blocks(loci, partial_start)
+
+		entry = None
+		try:
+			for locus, records, locus_complete in blocks:
+				if metrics is not None and metrics.current_locus is None:
+					metrics.start_locus(locus.label, writer.records_written, writer.bytes_written)
+				if records is None:
+					##
+					## Cache hit; if the entry was evicted in the meantime, generate it after all
+					try:
+						self.cache.splice(self.cache_key(locus), writer)
+						writer.end_locus()
+						if metrics is not None:
+							metrics.end_locus(writer.records_written, writer.bytes_written, cached=True)
+						if journal is not None:
+							journal.end_locus(writer, locus)
+						continue
+					except FileNotFoundError:
+						records = self.generate_loci_reference(locus)
+				##
+				## A locus resumed part way through is not cached; its start is already in the output
+				if self.cache is not None and not partial_start:
+					if entry is None:
+						entry = self.cache.entry(self.cache_key(locus))
+					records = entry.tee(records)
+				if journal is not None:
+					journal.write_records(writer, locus, records)
+				else:
+					writer.write_records(records)
+				if locus_complete:
+					if entry is not None:
+						entry.commit()
+						entry = None
+					writer.end_locus()
+					partial_start = 0
+					if metrics is not None:
+						metrics.end_locus(writer.records_written, writer.bytes_written)
+					if journal is not None:
+						journal.end_locus(writer, locus)
+		except BaseException:
+			if entry is not None:
+				entry.discard()
+			raise
+
+		##
+		## Everything is written; a run killed while finalising resumes straight to the rename
+		if journal is not None:
+			journal.checkpoint(writer, None)
+
+	def locus_blocks(self, loci, partial_start=0):
+
+		"""
+		Single process counterpart of parallel_records: (locus, records or None for a cache hit, True)
+		The first locus starts at partial_start (a resumed run)
+		"""
+
+		for locus in loci:
+			if partial_start:
+				yield locus, haplotype_records(locus, self.silent_flag, self.ordering, partial_start), True
+				partial_start = 0
+			else:
+				yield locus, None if self.cached(locus) else self.generate_loci_reference(locus), True
+
+def generate(config, **options):
+
+	"""
+	Iterator of (label, sequence) records for config; options as for Generator
+	"""
+
+	return Generator(**options).records(config)
@@ -0,0 +1,93 @@
+##
+## Generic imports
+import zlib
+import struct
+
+##
+## BGZF (blocked gzip) constants, as per the SAM/BAM specification
+## Each block is a complete gzip member with a 'BC' extra field carrying the block size
+BLOCK_DATA_SIZE = 0xff00
+BLOCK_HEADER = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+EOF_BLOCK = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+class BgzfWriter(object):
+
+	"""
+	Minimal pure-python BGZF compressor.
+	Data is cut into blocks of at most BLOCK_DATA_SIZE uncompressed bytes, each deflated
+	independently, so the output can be random-accessed by samtools/htslib. The start of
+	every block after the first is recorded, giving the contents of a .gzi index for free.
+	"""
+
+	def __init__(self, handle, compresslevel=6):
+
+		##
+		## Instance variables
+		self.handle = handle
+		self.compresslevel = compresslevel
+		self.buffer = bytearray()
+		self.compressed_offset = 0
+		self.uncompressed_offset = 0
+		self.block_offsets = []
+
+	def write(self, data):
+
+		self.buffer += data
+		while len(self.buffer) >= BLOCK_DATA_SIZE:
+			self.write_block(bytes(self.buffer[:BLOCK_DATA_SIZE]))
+			del self.buffer[:BLOCK_DATA_SIZE]
+
+	def write_block(self, data):
+
+		"""
+		Deflates a single block and writes header, payload and CRC/ISIZE trailer
+		"""
+
+		compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -15)
+		payload = compressor.compress(data) + compressor.flush()
+		block_size = len(BLOCK_HEADER) + 2 + len(payload) + 8
+		self.handle.write(BLOCK_HEADER)
+		self.handle.write(struct.pack('<H', block_size - 1))
+		self.handle.write(payload)
+		self.handle.write(struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data)))
+
+		##
+		## Where the next block begins, in both coordinate spaces (.gzi entry)
+		self.compressed_offset += block_size
+		self.uncompressed_offset += len(data)
+		self.block_offsets.append((self.compressed_offset, self.uncompressed_offset))
+
+	def flush(self):
+
+		"""
+		Compresses whatever is buffered into a (possibly short) block
+		"""
+
+		if self.buffer:
+			self.write_block(bytes(self.buffer))
+			del self.buffer[:]
+		self.handle.flush()
+
+	def finish(self):
+
+		"""
+		Flushes the last block and appends the empty BGZF end-of-file marker block
+		The underlying handle is left open for the caller to sync and close
+		"""
+
+		self.flush()
+		self.handle.write(EOF_BLOCK)
+
+	def write_gzi(self, gzi_path):
+
+		"""
+		Writes the .gzi index: entry count, then (compressed, uncompressed) offset pairs
+		for the start of every data block; the implicit first block at (0, 0) and the
+		EOF marker block are not stored, matching htslib
+		"""
+
+		block_starts = self.block_offsets[:-1]
+		with open(gzi_path, 'wb') as gzi_file:
+			gzi_file.write(struct.pack('<Q', len(block_starts)))
+			for compressed_offset, uncompressed_offset in block_starts:
+				gzi_file.write(struct.pack('<QQ', compressed_offset, uncompressed_offset))
@@ -0,0 +1,178 @@
+##
+## Content-addressed on-disk cache of generated locus blocks
+## A locus' formatted records depend only on its definition and the output options, so the block
+## is stored under a hash of exactly those; rebuilding a panel after editing one locus only
+## regenerates that locus, every other one is spliced straight from the cache into the output
+
+##
+## Generic imports
+import os
+import json
+import hashlib
+import tempfile
+
+##
+## Subpackage/s??
+from .output import format_record, fai_name
+
+##
+## Bump when the block format changes, so stale entries are never spliced
+CACHE_VERSION = 1
+DEFAULT_CACHE_SIZE = 10 * 1024**3
+
+def locus_key(locus, silent_flag, ordering):
+
+	"""
+	Canonical hash of everything that determines a locus' block
+	"""
+
+	canonical = {'version': CACHE_VERSION,
+				 'label': locus.label,
+				 'fiveprime': locus.fiveprime,
+				 'threeprime': locus.threeprime,
+				 'regions': [[region.unit, region.start, region.end, region.order, region.intervening, region.step] for region in locus.regions],
+				 'constraints': [[constraint.first, constraint.relation, constraint.second, constraint.offset] for constraint in locus.constraints],
+				 'length': [locus.min_length, locus.max_length],
+				 'sample': [locus.sample, locus.seed],
+				 'ordering': locus.ordering or ordering,
+				 'silent': bool(silent_flag)}
+	encoded = json.dumps(canonical, sort_keys=True, separators=(',', ':')).encode()
+	return hashlib.sha256(encoded).hexdigest()
+
+def remove_quietly(path):
+
+	##
+	## Another process sharing the cache may have removed it first
+	try:
+		os.remove(path)
+	except FileNotFoundError:
+		pass
+
+class CacheEntry(object):
+
+	"""
+	A block being written into the cache alongside the output (on a cache miss)
+	Nothing is visible in the cache until commit(); discard() abandons the block
+	Every writer has its own temporary files, so processes sharing a cache never write into each other's blocks
+	"""
+
+	def __init__(self, cache, key):
+
+		self.cache = cache
+		self.key = key
+		self.block_path, self.index_path = cache.paths(key)
+		block_handle, self.block_temp = tempfile.mkstemp(dir=cache.directory, prefix=key + '.', suffix='.fa.tmp')
+		index_handle, self.index_temp = tempfile.mkstemp(dir=cache.directory, prefix=key + '.', suffix='.idx.tmp')
+		for path in (self.block_temp, self.index_temp):
+			os.chmod(path, 0o644)
+		self.block_file = os.fdopen(block_handle, 'wb')
+		self.index_file = os.fdopen(index_handle, 'w')
+		self.block_bytes = 0
+
+	def tee(self, records):
+
+		"""
+		Passes records through unchanged, copying each into the block as it goes by
+		"""
+
+		for label, sequence in records:
+			record_bytes, sequence_offset = format_record(label, sequence)
+			self.block_file.write(record_bytes)
+			self.index_file.write('{}\t{}\t{}\n'.format(fai_name(label), len(sequence), self.block_bytes + sequence_offset))
+			self.block_bytes += len(record_bytes)
+			yield label, sequence
+
+	def commit(self):
+
+		##
+		## The index goes in first; an entry only exists once its block has been renamed into place
+		## If another process committed the same key meanwhile, its (identical) block is kept instead
+		if self.cache.contains(self.key):
+			self.discard()
+			return
+		self.block_file.close()
+		self.index_file.close()
+		os.replace(self.index_temp, self.index_path)
+		os.replace(self.block_temp, self.block_path)
+		self.cache.evict()
+
+	def discard(self):
+
+		self.block_file.close()
+		self.index_file.close()
+		for path in (self.block_temp, self.index_temp):
+			remove_quietly(path)
+
+class LocusCache(object):
+
+	"""
+	Size bounded, least recently used cache directory of locus blocks
+	Each entry is <key>.fa (records exactly as written to the output) and <key>.idx
+	(name, length, sequence offset per record, for .fai generation when splicing)
+	"""
+
+	def __init__(self, directory, max_bytes=DEFAULT_CACHE_SIZE):
+
+		self.directory = directory
+		self.max_bytes = max_bytes
+		self.hits = 0
+		self.misses = 0
+		os.makedirs(self.directory, exist_ok=True)
+
+	def paths(self, key):
+
+		block_path = os.path.join(self.directory, key + '.fa')
+		return block_path, block_path[:-3] + '.idx'
+
+	def contains(self, key):
+		return os.path.exists(self.paths(key)[0])
+
+	def entry(self, key):
+
+		self.misses += 1
+		return CacheEntry(self, key)
+
+	def splice(self, key, writer):
+
+		"""
+		Copies a cached block into writer; raises FileNotFoundError if it has gone
+		Hits are touched, so recently used blocks are the last to be evicted
+		"""
+
+		block_path, index_path = self.paths(key)
+		with open(block_path, 'rb') as block_file, open(index_path, 'r') as index_file:
+			block_index = ((fields[0], int(fields[1]), int(fields[2])) for fields in (line.rstrip('\n').split('\t') for line in index_file))
+			writer.splice(block_file, block_index)
+		self.hits += 1
+		try:
+			os.utime(block_path)
+		except FileNotFoundError:
+			pass
+
+	def evict(self):
+
+		"""
+		Removes least recently used entries until the cache fits within max_bytes
+		"""
+
+		entries = []
+		total = 0
+		for name in os.listdir(self.directory):
+			if not name.endswith('.fa'):
+				continue
+			block_path = os.path.join(self.directory, name)
+			index_path = block_path[:-3] + '.idx'
+			try:
+				status = os.stat(block_path)
+				size = status.st_size + os.path.getsize(index_path)
+			except OSError:
+				continue
+			entries.append((status.st_mtime, size, block_path, index_path))
+			total += size
+
+		entries.sort()
+		while total > self.max_bytes and entries:
+			mtime, size, block_path, index_path = entries.pop(0)
+			for path in (block_path, index_path):
+				remove_quietly(path)
+			total -= size
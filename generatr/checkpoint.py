@@ -0,0 +1,274 @@
+##
+## Checkpointed, resumable generation
+## Plain output is written to '<output>.part' as usual; a journal next to it ('<output>.journal', JSON lines)
+## records checkpoints: how many loci are complete, how far into the product of the current locus output has
+## got, and the records/bytes written up to there, with a hash of the output written since the previous
+## checkpoint and a digest of the locus definitions behind it. A killed run leaves both files behind; resuming
+## re-hashes the '.part' prefix against the journal, cuts it back to the last checkpoint that matches, and
+## generates on from that locus/position (haplotype slices start mid-product, nothing earlier is regenerated).
+
+##
+## Generic imports
+import os
+import json
+import time
+import hashlib
+from itertools import islice
+
+##
+## Subpackage/s??
+from .output import FastaWriter
+from .cache import locus_key
+from .ordering import DEFAULT_ORDERING
+
+CHECKPOINT_VERSION = 1
+CHECKPOINT_INTERVAL = 60.0
+
+##
+## Records written between looks at the clock (and at stop requests), and the read size when hashing output
+CHECKPOINT_RECORDS = 10000
+HASH_CHUNK = 1024*1024
+
+class CheckpointError(Exception):
+	pass
+
+class RunInterrupted(Exception):
+	pass
+
+def journal_path(output_path):
+	return output_path + '.journal'
+
+def chain_digest(digest, key):
+
+	##
+	## Running digest of the locus definitions written so far, one locus key at a time
+	return hashlib.sha256('{}:{}'.format(digest, key).encode()).hexdigest()
+
+def hash_segment(handle, start, stop):
+
+	"""
+	sha256 of bytes [start, stop) of a file opened for reading
+	"""
+
+	segment_hash = hashlib.sha256()
+	handle.seek(start)
+	remaining = stop - start
+	while remaining > 0:
+		chunk = handle.read(min(HASH_CHUNK, remaining))
+		if not chunk:
+			break
+		segment_hash.update(chunk)
+		remaining -= len(chunk)
+	return segment_hash.hexdigest() if remaining == 0 else None
+
+class CheckpointJournal(object):
+
+	"""
+	Journal of checkpoints for one (plain, unsharded) output file
+	writer() opens the output, at the last verified checkpoint when resuming; api.Generator.write_loci
+	then reports records and completed loci, and a checkpoint is taken every interval seconds.
+	request_stop() (e.g. from a SIGTERM handler) makes the run checkpoint and raise RunInterrupted
+	at the next safe point, rather than dying part way through a record
+	"""
+
+	def __init__(self, output_path, silent_flag=False, ordering=DEFAULT_ORDERING, interval=CHECKPOINT_INTERVAL, resume=False):
+
+		##
+		## Instance variables
+		self.output_path = output_path
+		self.path = journal_path(output_path)
+		self.silent_flag = silent_flag
+		self.ordering = ordering
+		self.interval = interval
+		self.resume = resume
+		self.header = {'version': CHECKPOINT_VERSION, 'output': os.path.basename(output_path),
+					   'silent': silent_flag, 'ordering': ordering}
+
+		##
+		## Position reached: loci complete, records into the current locus, and the checkpoint resumed from
+		self.locus = 0
+		self.position = 0
+		self.digest = hashlib.sha256().hexdigest()
+		self.resumed = None
+		self.last = {'records': 0, 'bytes': 0}
+		self.last_time = time.monotonic()
+		self.stop_requested = False
+		self.journal_file = None
+
+	def load(self):
+
+		"""
+		Checkpoints of an existing journal, in order; a final line cut short by a kill is ignored
+		Raises CheckpointError if the journal belongs to a different output or options
+		"""
+
+		checkpoints = []
+		with open(self.path, 'r') as journal_file:
+			lines = journal_file.read().split('\n')
+		try:
+			header = json.loads(lines[0])
+		except ValueError:
+			raise CheckpointError('Unreadable checkpoint journal {}'.format(self.path))
+		if header != self.header:
+			raise CheckpointError('Checkpoint journal {} was written with different options ({}); remove it to start afresh'.format(
+				self.path, ', '.join('{}={}'.format(name, header.get(name)) for name in sorted(self.header))))
+		for line in lines[1:]:
+			try:
+				checkpoints.append(json.loads(line))
+			except ValueError:
+				break
+		return checkpoints
+
+	def verify(self, checkpoints):
+
+		"""
+		The last checkpoint whose output (and every one before it) matches the '.part' file, or None
+		"""
+
+		verified = None
+		partial_path = self.output_path + '.part'
+		if not os.path.exists(partial_path):
+			return None
+		with open(partial_path, 'rb') as partial_file:
+			start = 0
+			for checkpoint in checkpoints:
+				if hash_segment(partial_file, start, checkpoint['bytes']) != checkpoint['sha256']:
+					break
+				verified = checkpoint
+				start = checkpoint['bytes']
+		return verified
+
+	def writer(self):
+
+		"""
+		Opens the output; when resuming, from the last verified checkpoint (if there is one)
+		The journal is (re)written with just the checkpoints it carries on from
+		"""
+
+		checkpoints = []
+		if self.resume and os.path.exists(self.path):
+			checkpoints = self.load()
+			self.resumed = self.verify(checkpoints)
+			checkpoints = checkpoints[:checkpoints.index(self.resumed) + 1] if self.resumed is not None else []
+
+		with open(self.path + '.part', 'w') as journal_file:
+			for entry in [self.header] + checkpoints:
+				journal_file.write(json.dumps(entry, sort_keys=True) + '\n')
+		os.replace(self.path + '.part', self.path)
+		self.journal_file = open(self.path, 'a')
+
+		if self.resumed is None:
+			return FastaWriter(self.output_path, keep_partial=True)
+		self.locus = self.resumed['locus']
+		self.position = self.resumed['position']
+		self.digest = self.resumed['loci']
+		self.last = self.resumed
+		return FastaWriter(self.output_path, keep_partial=True, resume_at=(self.resumed['records'], self.resumed['bytes']))
+
+	def remaining(self, loci):
+
+		"""
+		Skips the loci which are complete in the output, yielding the rest (the first of which may be
+		part written); raises CheckpointError if the config no longer matches what was written
+		"""
+
+		if self.resumed is None:
+			for locus in loci:
+				yield locus
+			return
+
+		digest = hashlib.sha256().hexdigest()
+		seen = 0
+		for locus in loci:
+			seen += 1
+			if seen <= self.locus:
+				digest = chain_digest(digest, locus_key(locus, self.silent_flag, self.ordering))
+				continue
+			if seen == self.locus + 1:
+				self.check_config(digest, locus)
+			yield locus
+
+		##
+		## Every locus was already complete (or the config has lost some)
+		if seen <= self.locus:
+			self.check_config(digest, None)
+
+	def check_config(self, digest, locus):
+
+		if digest != self.resumed['loci'] or (self.position and (locus is None or locus_key(locus, self.silent_flag, self.ordering) != self.resumed['key'])):
+			raise CheckpointError('The config has changed since {} was checkpointed; remove {} to start afresh'.format(self.output_path, self.path))
+
+	def write_records(self, writer, locus, records):
+
+		"""
+		Writes records of locus, checkpointing every interval seconds (between records)
+		"""
+
+		records = iter(records)
+		while True:
+			written = writer.records_written
+			writer.write_records(islice(records, CHECKPOINT_RECORDS))
+			if writer.records_written == written:
+				return
+			self.position += writer.records_written - written
+			self.tick(writer, locus)
+
+	def end_locus(self, writer, locus):
+
+		"""
+		Called once a locus is complete (terminator included)
+		"""
+
+		self.digest = chain_digest(self.digest, locus_key(locus, self.silent_flag, self.ordering))
+		self.locus += 1
+		self.position = 0
+		self.tick(writer, None)
+
+	def tick(self, writer, locus):
+
+		##
+		## Checkpoint when due, or when a stop was requested (then stop)
+		if self.stop_requested:
+			self.checkpoint(writer, locus)
+			raise RunInterrupted('Stopped at a checkpoint ({} records, {} bytes); {} can be resumed'.format(
+				writer.records_written, writer.bytes_written, self.output_path))
+		if time.monotonic() - self.last_time >= self.interval:
+			self.checkpoint(writer, locus)
+
+	def checkpoint(self, writer, locus):
+
+		"""
+		Syncs the output and appends a checkpoint for the current position to the journal
+		locus is the locus part written (None between loci)
+		"""
+
+		self.last_time = time.monotonic()
+		if writer.bytes_written == self.last['bytes'] and self.position == self.last.get('position', 0) and self.locus == self.last.get('locus', 0):
+			return
+		writer.sync()
+		with open(writer.partial_path, 'rb') as partial_file:
+			segment_hash = hash_segment(partial_file, self.last['bytes'], writer.bytes_written)
+		entry = {'locus': self.locus, 'position': self.position,
+				 'records': writer.records_written, 'bytes': writer.bytes_written,
+				 'sha256': segment_hash, 'loci': self.digest,
+				 'key': locus_key(locus, self.silent_flag, self.ordering) if self.position else None,
+				 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+		self.journal_file.write(json.dumps(entry, sort_keys=True) + '\n')
+		self.journal_file.flush()
+		os.fsync(self.journal_file.fileno())
+		self.last = entry
+
+	def request_stop(self):
+		self.stop_requested = True
+
+	def close(self, completed):
+
+		"""
+		Closes the journal; it is removed once the output is complete, otherwise kept to resume from
+		"""
+
+		if self.journal_file is not None:
+			self.journal_file.close()
+			self.journal_file = None
+		if completed and os.path.exists(self.path):
+			os.remove(self.path)
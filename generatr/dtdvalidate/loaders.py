@@ -0,0 +1,327 @@
+##
+## Compact config formats, alongside the DTD validated XML
+## Loaders stream 'locus records' out of a file, one at a time: plain dictionaries such as
+##   {'label': 'HTT', 'fiveprime': 'GCG..', 'threeprime': 'CCT..',
+##    'regions': [{'unit': 'CAG', 'start': 1, 'end': 100, 'step': 1}, ..],
+##    'intervening': [{'prior': 1, 'sequence': 'CAACAGCCGCCA'}],
+##    'constraints': [{'first': 2, 'relation': 'le', 'second': 1, 'offset': 0}],
+##    'ordering': .., 'min_length': .., 'max_length': .., 'sample': .., 'seed': ..}
+## record_to_raw() checks a record against the same structure xml_rules.dtd imposes on a <loci> element
+## and converts it to the raw locus the XML reader produces, so the ruleset and model are shared.
+## Further formats can be added with register_loader().
+
+##
+## Generic imports
+import json
+
+##
+## Record schema: top level fields, and the fields of each list entry (required ones first)
+LOCUS_ATTRIBUTES = ('ordering', 'min_length', 'max_length', 'sample', 'seed')
+RECORD_FIELDS = ('label', 'fiveprime', 'threeprime', 'regions', 'intervening', 'constraints') + LOCUS_ATTRIBUTES
+ENTRY_FIELDS = {'regions': (('unit', 'start', 'end'), ('step', 'order')),
+				'intervening': (('prior', 'sequence'), ()),
+				'constraints': (('first', 'relation', 'second'), ('offset',))}
+ENTRY_TYPES = {'regions': 'repeat_region', 'intervening': 'intervening', 'constraints': 'constraint'}
+VALID_ORDERINGS = ('colexicographic', 'lexicographic')
+
+##
+## Tables: missing values, list separators, and how much of a JSON array is read at a time
+MISSING_VALUES = ('', '.')
+ITEM_SEPARATOR = ';'
+FIELD_SEPARATOR = ':'
+JSON_CHUNK = 64*1024
+
+##
+## Extension -> loader; a loader takes a path and yields (location, record) tuples
+LOADERS = {}
+
+def register_loader(extensions, loader):
+
+	"""
+	Makes loader(config_filename) -> iterator of (location, record) available for the given extensions
+	"""
+
+	for extension in extensions:
+		LOADERS[extension.lower()] = loader
+	return loader
+
+def loader_for(config_filename):
+
+	"""
+	The loader registered for a file's extension (longest match), or None (i.e. XML, or unknown)
+	"""
+
+	name = str(config_filename).lower()
+	for extension in sorted(LOADERS, key=len, reverse=True):
+		if name.endswith(extension):
+			return LOADERS[extension]
+	return None
+
+def text_value(value):
+
+	##
+	## Records from JSON/YAML carry numbers; the ruleset works on attribute strings, as from XML
+	if isinstance(value, bool) or not isinstance(value, (str, int)):
+		raise TypeError(type(value).__name__)
+	return str(value)
+
+def flank_input(field, record, inputs, errors):
+
+	##
+	## Flanks are sequences, so must be text; anything else is reported and left out of the raw locus
+	flank = record.get(field)
+	if flank is None:
+		return
+	if not isinstance(flank, str):
+		errors.append('Invalid {} value in {}, expecting text'.format(type(flank).__name__, field))
+		return
+	inputs.append({'@type': field, '@flank': flank})
+
+def record_to_raw(record):
+
+	"""
+	Checks a locus record against the schema (the equivalent of xml_rules.dtd) and converts it to
+	a raw locus, {'@label': .., 'input': [{'@type': .., ..}, ..]}; returns (raw_locus, errors)
+	"""
+
+	errors = []
+	if not isinstance(record, dict):
+		return {'@label': '', 'input': []}, ['Locus record is a {}, expecting a mapping'.format(type(record).__name__)]
+	for field in record:
+		if field not in RECORD_FIELDS:
+			errors.append('Unknown field "{}"'.format(field))
+
+	raw_locus = {'@label': ''}
+	if record.get('label') in (None, ''):
+		errors.append('Missing locus label')
+	for field in ('label',) + LOCUS_ATTRIBUTES:
+		if record.get(field) is None:
+			continue
+		try:
+			raw_locus['@' + field] = text_value(record[field])
+		except TypeError as error:
+			errors.append('Invalid {} value in {}, expecting text or an integer'.format(error, field))
+	if raw_locus.get('@ordering', VALID_ORDERINGS[0]) not in VALID_ORDERINGS:
+		errors.append('Invalid ordering "{}", expecting one of {}'.format(raw_locus['@ordering'], ', '.join(VALID_ORDERINGS)))
+
+	##
+	## Sequence parameters in the order the XML would list them: 5' flank, repeat regions and
+	## intervening sequences, constraints, 3' flank
+	inputs = []
+	flank_input('fiveprime', record, inputs, errors)
+	for field in ('regions', 'intervening', 'constraints'):
+		entries = record.get(field) or []
+		if not isinstance(entries, list):
+			errors.append('Invalid {} value in {}, expecting a list'.format(type(entries).__name__, field))
+			continue
+		required, optional = ENTRY_FIELDS[field]
+		for index, entry in enumerate(entries):
+			description = '{} #{}'.format(field, index+1)
+			if not isinstance(entry, dict):
+				errors.append('Invalid {} value in {}, expecting a mapping'.format(type(entry).__name__, description))
+				continue
+			parameters = {'@type': ENTRY_TYPES[field]}
+			if field == 'regions':
+				parameters['@order'] = str(index + 1)
+			for name, value in entry.items():
+				if name not in required + optional:
+					errors.append('Unknown field "{}" in {}'.format(name, description))
+					continue
+				try:
+					parameters['@' + name] = text_value(value)
+				except TypeError as error:
+					errors.append('Invalid {} value in {} {}, expecting text or an integer'.format(error, description, name))
+			for name in required:
+				if name not in entry:
+					errors.append('Missing {} in {}'.format(name, description))
+			inputs.append(parameters)
+	flank_input('threeprime', record, inputs, errors)
+
+	if not inputs:
+		errors.append('Locus has no sequence parameters (flanks or repeat regions)')
+	raw_locus['input'] = inputs
+	return raw_locus, errors
+
+def table_record(columns, fields):
+
+	"""
+	One table row as a locus record; list columns are ';' separated items of ':' separated fields:
+	regions UNIT:START-END[:STEP] (or UNIT:COUNT), intervening PRIOR:SEQUENCE,
+	constraints FIRST:RELATION:SECOND[:OFFSET]. Malformed items are kept for validation to report
+	"""
+
+	record = {}
+	if len(fields) > len(columns):
+		record['extra columns'] = fields[len(columns):]
+	for column, value in zip(columns, fields):
+		value = value.strip()
+		if value in MISSING_VALUES:
+			continue
+		if column not in ENTRY_FIELDS:
+			record[column] = value
+			continue
+		entries = []
+		for item in value.split(ITEM_SEPARATOR):
+			parts = item.strip().split(FIELD_SEPARATOR)
+			if column == 'regions':
+				entry = {'unit': parts[0]}
+				if len(parts) > 1 and parts[1]:
+					counts = parts[1].split('-', 1)
+					entry['start'] = counts[0]
+					entry['end'] = counts[-1]
+				if len(parts) > 2:
+					entry['step'] = parts[2]
+			elif column == 'intervening':
+				entry = dict(zip(('prior', 'sequence'), parts))
+			else:
+				entry = dict(zip(('first', 'relation', 'second', 'offset'), parts))
+			if len(parts) > {'regions': 3, 'intervening': 2, 'constraints': 4}[column]:
+				entry['extra fields'] = parts
+			entries.append(entry)
+		record[column] = entries
+	return record
+
+def load_table(config_filename):
+
+	"""
+	Tab separated locus table (TSV/BED-like), one locus per row, streamed line by line
+	The first line names the columns (a leading '#' is allowed), from RECORD_FIELDS in any order;
+	further '#' lines are comments, and '' or '.' is a missing value
+	"""
+
+	columns = None
+	with open(config_filename, 'r') as table:
+		for line_number, line in enumerate(table, 1):
+			line = line.rstrip('\r\n')
+			if not line.strip():
+				continue
+			if columns is None:
+				columns = [column.strip().lower() for column in line.lstrip('#').split('\t')]
+				unknown = [column for column in columns if column not in RECORD_FIELDS]
+				if unknown or 'label' not in columns:
+					raise ValueError('line {}: header must name the columns, from {} (label is required); unknown: {}'.format(
+						line_number, ', '.join(RECORD_FIELDS), ', '.join(unknown) or 'none'))
+				continue
+			if line.startswith('#'):
+				continue
+			yield 'line {}'.format(line_number), table_record(columns, line.split('\t'))
+
+def iter_json_array(handle):
+
+	"""
+	Incrementally decodes the elements of a top level JSON array, reading JSON_CHUNK at a time
+	"""
+
+	decoder = json.JSONDecoder()
+	buffer = ''
+	position = 0
+	started = False
+	elements = 0
+	separated = False
+	exhausted = False
+	while True:
+
+		##
+		## Skip whitespace, and exactly one ',' between elements, topping up the buffer as needed
+		while True:
+			while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','):
+				if buffer[position] == ',':
+					if not elements or separated:
+						raise ValueError('unexpected "," in JSON array')
+					separated = True
+				position += 1
+			if position < len(buffer) or exhausted:
+				break
+			chunk = handle.read(JSON_CHUNK)
+			exhausted = not chunk
+			buffer, position = buffer[position:] + chunk, 0
+		if position == len(buffer):
+			raise ValueError('unexpected end of JSON array')
+		if not started:
+			if buffer[position] != '[':
+				raise ValueError('expecting a JSON array of locus records')
+			started = True
+			position += 1
+			continue
+		if buffer[position] == ']':
+			if separated:
+				raise ValueError('unexpected "," before the end of JSON array')
+			return
+		if elements and not separated:
+			raise ValueError('expecting "," between elements of JSON array')
+
+		##
+		## Decode the next element; an element cut off by the end of the buffer needs more input
+		while True:
+			try:
+				element, end = decoder.raw_decode(buffer, position)
+				break
+			except ValueError:
+				if exhausted:
+					raise
+				chunk = handle.read(JSON_CHUNK)
+				exhausted = not chunk
+				buffer, position = buffer[position:] + chunk, 0
+		yield element
+		elements += 1
+		separated = False
+		buffer, position = buffer[end:], 0
+
+def load_json(config_filename):
+
+	"""
+	JSON: an array of locus records (streamed), or an object holding them under 'loci' (read whole)
+	"""
+
+	with open(config_filename, 'r') as handle:
+		first = handle.read(JSON_CHUNK)
+		handle.seek(0)
+		if first.lstrip().startswith('['):
+			for index, record in enumerate(iter_json_array(handle), 1):
+				yield 'record {}'.format(index), record
+			return
+		document = json.load(handle)
+	records = document.get('loci') if isinstance(document, dict) else None
+	if not isinstance(records, list):
+		raise ValueError('expecting a JSON array of locus records, or an object with a "loci" array')
+	for index, record in enumerate(records, 1):
+		yield 'record {}'.format(index), record
+
+def load_json_lines(config_filename):
+
+	"""
+	JSON lines: one locus record per line
+	"""
+
+	with open(config_filename, 'r') as handle:
+		for line_number, line in enumerate(handle, 1):
+			if line.strip():
+				yield 'line {}'.format(line_number), json.loads(line)
+
+def load_yaml(config_filename):
+
+	"""
+	YAML: one locus record per document ('---' separated, streamed), or documents holding
+	a list of records (or a mapping with a 'loci' list). Requires PyYAML
+	"""
+
+	try:
+		import yaml
+	except ImportError:
+		raise ValueError('YAML configs require PyYAML (pip install pyyaml)')
+	with open(config_filename, 'r') as handle:
+		index = 0
+		try:
+			for document in yaml.safe_load_all(handle):
+				if isinstance(document, dict) and 'loci' in document:
+					document = document['loci']
+				for record in (document if isinstance(document, list) else [document]):
+					index += 1
+					yield 'record {}'.format(index), record
+		except yaml.YAMLError as error:
+			raise ValueError(str(error))
+
+register_loader(('.tsv', '.bed', '.tab'), load_table)
+register_loader(('.json',), load_json)
+register_loader(('.jsonl', '.ndjson'), load_json_lines)
+register_loader(('.yaml', '.yml'), load_yaml)
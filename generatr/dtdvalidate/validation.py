@@ -1,8 +1,31 @@
-import sys
+import re
 import logging as log
-from collections import defaultdict
-from xml.etree import cElementTree
-from lxml import etree
+from functools import lru_cache
+
+##
+## Compact (non XML) config formats
+from .loaders import loader_for, record_to_raw
+
+##
+## lxml is only imported once a config is actually validated (see load_dtd/parse_loci),
+## so importing generatr -- or running with --no-validate -- does not pay for it
+
+##
+## Ruleset for sequence parameters
+## Whole sequences are checked at C speed: translating away every valid base leaves
+## nothing behind for a valid sequence; only failing sequences are scanned for positions
+VALID_TYPES = ('fiveprime','repeat_region','intervening','threeprime','constraint')
+VALID_RELATIONS = ('lt','le','eq','ge','gt')
+SELECTION_ATTRIBUTES = ('@min_length','@max_length','@sample','@seed')
+REQUIRED_ATTRIBUTES = {'fiveprime': ('@flank',), 'threeprime': ('@flank',),
+					   'repeat_region': ('@unit','@start','@end','@order'),
+					   'intervening': ('@sequence','@prior'),
+					   'constraint': ('@first','@relation','@second')}
+SIGNED_INTEGER = re.compile('^-?[0-9]+$')
+VALID_BASES = 'ATGCUN'
+VALID_BASE_DELETION = str.maketrans('', '', VALID_BASES)
+INVALID_BASE = re.compile('[^{}]'.format(VALID_BASES))
+REPORTED_POSITIONS = 10
 
 class Colour:
 
@@ -20,183 +43,334 @@ class Colour:
 	underline = '\033[4m'
 	end = '\033[0m'
 
+@lru_cache(maxsize=None)
+def load_dtd(dtd_filename):
+
+	"""
+	Opens and compiles a DTD ruleset once per process; subsequent readers share it
+	"""
+
+	from lxml import etree
+	with open(dtd_filename, 'r') as dtd_file:
+		return etree.DTD(dtd_file)
+
+class ConfigError(Exception):
+
+	"""
+	Raised when a configuration file is missing, malformed, or fails validation
+	"""
+
+	pass
+
 class ConfigReader(object):
 
 	"""
 	The configuration file reader.
 	Opens a configuration file, and if valid, converts the parameters within the file to a dictionary object,
 	reader to be viewed through accessing the config_dict variable.
+	The file is read in a single streaming pass: each <loci> element is validated against the (cached) DTD
+	and then the ruleset as soon as it has been parsed, converted, and discarded from the tree. With
+	stream=True nothing is read up front; iter_loci() hands over loci one at a time as they are parsed.
+	With validate=False (trusted, pre-validated configs) neither the DTD nor the ruleset is applied, and
+	the file is read with the standard library parser instead of lxml.
+	Configs in a compact format (TSV/BED-like, JSON, JSON lines, YAML; see loaders.py) are streamed by
+	their loader instead, checked against the equivalent record schema and then the same ruleset.
 	"""
 
-	def __init__(self, dtdfile, config_filename=None):
+	def __init__(self, dtdfile, config_filename=None, stream=False, validate=True):
 
 		##
 		## Instance variables
 		self.config_filename = config_filename
 		self.dtd_filename = dtdfile
+		self.validate = validate
+		self.config_dict = None
+		self.trigger = False
 
 		##
 		## Check for configuration file (just incase)
 		if self.config_filename is None:
-			log.error("No configuration file specified!")
-		else:
-			self.config_file = etree.parse(self.config_filename)
+			raise ConfigError('No configuration file specified!')
+		self.loader = loader_for(self.config_filename)
+		self.dtd_object = load_dtd(self.dtd_filename) if validate and self.loader is None else None
 
 		##
-		## Check config vs dtd, parse info to dictionary, validate vs ruleset
-		self.validate_against_dtd()
-		self.set_dictionary()
-		self.trigger = self.validate_config()
+		## Check config vs dtd, parse info to dictionary, validate vs ruleset -- all in one pass
+		if not stream:
+			self.set_dictionary()
+
+	def validation_failure(self, line, message):
+
+		raise ConfigError('DTD validation failure {0}: line {1}: {2}'.format(self.config_filename, line, message))
 
-	def validate_against_dtd(self):
+	def iter_loci(self):
 
 		"""
-		Validate input config against DTD ruleset
-		i.e. confirms conformation of XML structure
+		Streams the configuration file, yielding one validated locus at a time as
+		{'@label': .., 'input': [{'@type': .., ..}, ..]} (plus any other loci attributes)
+		Elements are cleared once converted, so memory stays flat however many loci there are
 		"""
 
-		##
-		## Open > etree.DTD object
-		dtd_file = open(self.dtd_filename, 'r')
-		dtd_object = etree.DTD(dtd_file)
+		if self.loader is not None:
+			for raw_locus in self.parse_table_loci():
+				yield raw_locus
+			return
+		if not self.validate:
+			for raw_locus in self.parse_trusted_loci():
+				yield raw_locus
+			return
 
-		##
-		## If validation fails, close the object (memory) and raise an error
-		if not dtd_object.validate(self.config_file):
-			dtd_file.close()
-			log.error("DTD validation failure {0}: {1}".format(self.config_filename, dtd_object.error_log.filter_from_errors()[0]))
-			sys.exit(2)
-		dtd_file.close()
+		from lxml import etree
+		try:
+			for raw_locus in self.parse_loci():
+				yield raw_locus
+		except etree.XMLSyntaxError as error:
+			raise ConfigError('XML syntax error {0}: {1}'.format(self.config_filename, error))
+
+	def parse_trusted_loci(self):
+
+		"""
+		Fast path for trusted configs: no DTD, no ruleset, standard library parser
+		"""
+
+		from xml.etree import ElementTree
+		root = None
+		try:
+			for event, element in ElementTree.iterparse(self.config_filename, events=('start', 'end')):
+				if root is None:
+					root = element
+					continue
+				if event != 'end' or element.tag != 'loci':
+					continue
+				raw_locus = dict(('@' + k, v) for k, v in element.attrib.items())
+				raw_locus['input'] = [dict(('@' + k, v) for k, v in child.attrib.items()) for child in element]
+				root.clear()
+				yield raw_locus
+		except ElementTree.ParseError as error:
+			raise ConfigError('XML syntax error {0}: {1}'.format(self.config_filename, error))
+
+	def parse_table_loci(self):
+
+		"""
+		Streaming pass over a compact format config: each record is checked against the schema,
+		converted, and validated against the ruleset as it is read (failures handled as for XML)
+		"""
+
+		loci_count = 0
+		records = self.loader(self.config_filename)
+		while True:
+			try:
+				location, record = next(records)
+			except StopIteration:
+				break
+			except (ValueError, OSError) as error:
+				raise ConfigError('Unreadable config {0}: {1}'.format(self.config_filename, error))
+			raw_locus, locus_errors = record_to_raw(record)
+			loci_count += 1
+			if self.validate:
+				locus_errors += self.check_locus(raw_locus['input']) + self.check_selection(raw_locus)
+			elif locus_errors:
+				raise ConfigError('Unusable locus "{0}" ({1}) in {2}: {3}'.format(raw_locus.get('@label', ''), location, self.config_filename, locus_errors[0]))
+			if locus_errors:
+				self.trigger = True
+				self.report_locus(raw_locus.get('@label', ''), location, locus_errors)
+			if not self.trigger:
+				yield raw_locus
+
+		if not loci_count:
+			raise ConfigError('No loci found in {0}'.format(self.config_filename))
+		if self.trigger:
+			raise ConfigError('CFG: Config parameter validation failure {0}'.format(self.config_filename))
+		if self.validate:
+			log.info('{}{}{}{}'.format(Colour.green,'gtr__ ',Colour.end,'CFG: Config validation success!'))
+
+	def parse_loci(self):
+
+		"""
+		The streaming pass itself (see iter_loci)
+		"""
+
+		from lxml import etree
+		context = etree.iterparse(self.config_filename, events=('start', 'end'))
+		root = None
+		loci_count = 0
+		for event, element in context:
+
+			##
+			## Document element must be <data> (DTD: <!ELEMENT data (loci+)>)
+			if root is None:
+				root = element
+				if root.tag != 'data' or root.attrib:
+					self.validation_failure(root.sourceline, 'Document element must be a bare <data> element, got <{}>'.format(root.tag))
+				continue
+			if event != 'end' or element.getparent() is not root:
+				continue
+			if element.tag is etree.Comment or element.tag is etree.PI:
+				continue
+			if element.tag != 'loci' or (element.tail and element.tail.strip()):
+				self.validation_failure(element.sourceline, 'Element data content does not follow the DTD, expecting (loci)+')
+
+			##
+			## Validate this locus against the DTD, convert, and validate against the ruleset
+			if not self.dtd_object.validate(element):
+				self.validation_failure(element.sourceline, self.dtd_object.error_log.filter_from_errors()[0].message)
+			raw_locus = dict(('@' + k, v) for k, v in element.attrib.items())
+			raw_locus['input'] = [dict(('@' + k, v) for k, v in child.attrib.items()) for child in element]
+			locus_errors = self.check_locus(raw_locus['input']) + self.check_selection(raw_locus)
+
+			##
+			## Discard the converted element (and anything before it) from the tree
+			element.clear()
+			while element.getprevious() is not None:
+				del root[0]
+			loci_count += 1
+
+			##
+			## A failing locus is reported in full; no further loci are handed over, but the
+			## remainder of the file is still checked so that every failing locus is reported
+			if locus_errors:
+				self.trigger = True
+				self.report_locus(raw_locus.get('@label', ''), 'line {}'.format(element.sourceline), locus_errors)
+			if not self.trigger:
+				yield raw_locus
+
+		if not loci_count:
+			self.validation_failure(root.sourceline if root is not None else 0, 'Element data content does not follow the DTD, expecting (loci)+')
+		if self.trigger:
+			raise ConfigError('CFG: XML parameter validation failure {0}'.format(self.config_filename))
+		log.info('{}{}{}{}'.format(Colour.green,'gtr__ ',Colour.end,'CFG: XML Validation success!'))
 
 	def set_dictionary(self):
 
 		"""
-		Takes the now validated XML and extracts information from the tree into
-		a python dictionary {key: value}. This dictionary will be used for variables
-		within the pipeline. Recursion adapted from http://stackoverflow.com/a/9286702
+		Collects every locus from the stream into a python dictionary {key: value}, in the
+		shape the pipeline has always consumed: {'loci': locus} for a single locus,
+		or {'loci': [locus, locus, ..]} for multiple loci
 		"""
 
-		def recursive_generation(t):
+		loci = list(self.iter_loci())
+		self.config_dict = {'loci': loci[0] if len(loci) == 1 else loci}
+
+	@staticmethod
+	def check_sequence(sequence, description):
 
-			d = {t.tag: {} if t.attrib else None}
-			children = list(t)
+		"""
+		Checks a whole sequence against VALID_BASES in one pass
+		Returns a list of error strings (one per sequence, with the offending positions)
+		"""
+
+		if not sequence.translate(VALID_BASE_DELETION):
+			return []
+		invalid = [(match.start(), match.group()) for match in INVALID_BASE.finditer(sequence)]
+		positions = ', '.join('{}@{}'.format(character, position+1) for position, character in invalid[:REPORTED_POSITIONS])
+		if len(invalid) > REPORTED_POSITIONS:
+			positions += ', .. ({} in total)'.format(len(invalid))
+		return ['Invalid base character(s) in {}: {}'.format(description, positions)]
+
+	def check_locus(self, input_data):
+
+		"""
+		Method which validates one locus' sequence parameters against the ruleset.
+		Every problem within the locus is collected, rather than stopping at the first;
+		returns a list of error strings, empty if all settings for this locus are valid!
+		"""
+
+		errors = []
+		for index, sequence_parameters in enumerate(input_data):
 
 			##
-			## If list was populated, create dictionary, Append keys
-			if children:
-				dd = defaultdict(list)
+			## Check type integrity
+			param_type = sequence_parameters['@type']
+			description = '<input> #{} ({})'.format(index+1, param_type)
+			if not param_type in VALID_TYPES:
+				errors.append('Invalid parameter type in {}'.format(description))
+				continue
 
-				for dc in map(recursive_generation, children):
-					for k, v in dc.items():
-						dd[k].append(v)
-				d = {t.tag: {k: v[0] if len(v) == 1 else v for k, v in dd.items()}}
+			##
+			## Attributes this type cannot do without (the DTD cannot require them per type)
+			missing = [attribute for attribute in REQUIRED_ATTRIBUTES[param_type] if attribute not in sequence_parameters]
+			if missing:
+				errors.append('Missing attribute(s) in {}: {}'.format(description, ', '.join(attribute[1:] for attribute in missing)))
+				continue
 
 			##
-			## Values for key
-			if t.attrib:
-				d[t.tag].update(('@' + k, v) for k, v in t.attrib.items())
-
-			if t.text:
-				text = t.text.strip()
-				if children or t.attrib:
-					if text:
-						d[t.tag]['#text'] = text
-				else:
-					d[t.tag] = text
-			return d
+			## Test five/three prime flank integrity
+			if param_type == 'fiveprime' or param_type == 'threeprime':
+				errors.extend(self.check_sequence(sequence_parameters.get('@flank', ''), description + ' flank'))
 
-		##
-		## Takes the formatted xml doc, puts through generator, returns dictionary
-		string_repr = etree.tostring(self.config_file, pretty_print=True)
-		element_tree = cElementTree.XML(string_repr)
-
-		self.config_dict = recursive_generation(element_tree)
-		key_list_target = list(self.config_dict.keys())[0]
-		self.config_dict = self.config_dict[key_list_target]
-
-	def validate_config(self):
-
-		"""
-		Method which validates the configuration file's contents.
-		If all pass, guarantees that the settings dictionary is full of valid settings!
-		"""
-		valid_types = ['fiveprime','repeat_region','intervening','threeprime']
-		valid_bases = ['A','T','G','C','U','N']
-
-		def parameter_checker(input_data):
-
-			subtrigger = False
-
-			for sequence_parameters in input_data:
-
-				## Check type integrity
-				param_type = sequence_parameters['@type']
-				if not param_type in valid_types:
-					log.error('{}{}{}{}'.format(Colour.red,'gtr__ ',Colour.end,'CFG: Invalid parameter type detected in XML config.'))
-
-				##
-				## Test five prime flank integrity
-				if param_type == 'fiveprime':
-					fiveprime_flank = sequence_parameters['@flank']
-					for character in fiveprime_flank:
-						if not character in valid_bases:
-							log.error('{}{}{}{}'.format(Colour.red,'gtr__ ',Colour.end,'CFG: Invalid base character detected in five prime flank.'))
-							subtrigger=True
-
-				##
-				## Test repeat region(s) integrity
-				if param_type == 'repeat_region':
-					repeat_region = sequence_parameters['@unit']
-					for character in repeat_region:
-						if not character in valid_bases:
-							log.error('{}{}{}{}'.format(Colour.red,'gtr__ ',Colour.end,'CFG: Invalid base character detected in repeat unit.'))
-							subtrigger=True
-
-					region_start = sequence_parameters['@start']
-					region_end = sequence_parameters['@end']
-					region_order = sequence_parameters['@order']
-					for region in [region_start, region_end, region_order]:
-						if not region.isdigit():
-							log.error('{}{}{}{}'.format(Colour.red,'gtr__ ',Colour.end,'CFG: Non-integer character detected in repeat region start/end/order.'))
-							subtrigger=True
-
-				##
-				## Test intervening sequence(s) integrity
-				if param_type == 'intervening':
-					intevening_seq = sequence_parameters['@sequence']
-					for character in intevening_seq:
-						if not character in valid_bases:
-							log.error('{}{}{}{}'.format(Colour.red,'gtr__ ',Colour.end,'CFG: Invalid base character found in intervening sequence.'))
-							subtrigger=True
-
-				##
-				## Test three prime flank integrity
-				if param_type == 'threeprime':
-					threeprime_flank = sequence_parameters['@flank']
-					for character in threeprime_flank:
-						if not character in valid_bases:
-							log.error('{}{}{}{}'.format(Colour.red,'gtr__ ',Colour.end,'CFG: Invalid base character detected in three prime flank.'))
-							subtrigger=True
-
-			return subtrigger
-
-		trigger = False
-		for k,v in self.config_dict.items():
-
-			if type(v) == dict:
-				loci_data = v['input']
-				trigger = parameter_checker(loci_data)
-
-			if type(v) == list:
-				for loci_entry in v:
-					loci_data = loci_entry['input']
-					trigger = parameter_checker(loci_data)
-
-		if trigger:
-			log.error('{}{}{}{}'.format(Colour.red,'gtr__ ',Colour.end,'CFG: XML parameter validation failure. Exiting.'))
-			sys.exit(2)
-		else:
-			log.info('{}{}{}{}'.format(Colour.green,'gtr__ ',Colour.end,'CFG: XML Validation success!'))
+			##
+			## Test repeat region(s) integrity
+			if param_type == 'repeat_region':
+				errors.extend(self.check_sequence(sequence_parameters.get('@unit', ''), description + ' unit'))
+				for attribute in ('@start', '@end', '@order'):
+					value = sequence_parameters.get(attribute, '')
+					if not value.isdigit():
+						errors.append('Non-integer value in {} {}: "{}"'.format(description, attribute[1:], value))
+				value = sequence_parameters.get('@step', '1')
+				if not value.isdigit() or not int(value):
+					errors.append('Non-positive integer value in {} step: "{}"'.format(description, value))
+
+			##
+			## Test intervening sequence(s) integrity
+			if param_type == 'intervening':
+				errors.extend(self.check_sequence(sequence_parameters.get('@sequence', ''), description + ' sequence'))
+				value = sequence_parameters.get('@prior', '')
+				if not value.isdigit():
+					errors.append('Non-integer value in {} prior: "{}"'.format(description, value))
+
+			##
+			## Test constraint(s) integrity; count(first) <relation> count(second) + offset
+			if param_type == 'constraint':
+				for attribute in ('@first', '@second'):
+					value = sequence_parameters.get(attribute, '')
+					if not value.isdigit():
+						errors.append('Non-integer value in {} {}: "{}"'.format(description, attribute[1:], value))
+				value = sequence_parameters.get('@relation', '')
+				if not value in VALID_RELATIONS:
+					errors.append('Invalid relation in {}: "{}", expecting one of {}'.format(description, value, ', '.join(VALID_RELATIONS)))
+				value = sequence_parameters.get('@offset', '0')
+				if not SIGNED_INTEGER.match(value):
+					errors.append('Non-integer value in {} offset: "{}"'.format(description, value))
+
+		return errors
+
+	def check_selection(self, raw_locus):
+
+		"""
+		Validates a locus' subset selection: length window and sample attributes, and that
+		every constraint refers to a repeat region of the locus; returns a list of error strings
+		"""
+
+		errors = []
+		for attribute in SELECTION_ATTRIBUTES:
+			value = raw_locus.get(attribute)
+			if value is not None and not value.isdigit():
+				errors.append('Non-integer value in <loci> {}: "{}"'.format(attribute[1:], value))
+		if raw_locus.get('@sample', '1') == '0':
+			errors.append('<loci> sample must be at least 1')
+		window = [raw_locus.get(attribute, '') for attribute in ('@min_length', '@max_length')]
+		if all(value.isdigit() for value in window) and int(window[0]) > int(window[1]):
+			errors.append('<loci> min_length ({}) exceeds max_length ({})'.format(*window))
+
+		orders = set(parameters.get('@order') for parameters in raw_locus['input'] if parameters.get('@type') == 'repeat_region')
+		for index, parameters in enumerate(raw_locus['input']):
+			if parameters.get('@type') != 'constraint':
+				continue
+			for attribute in ('@first', '@second'):
+				value = parameters.get(attribute, '')
+				if value.isdigit() and value not in orders:
+					errors.append('<input> #{} (constraint) {} refers to repeat region order {}, which does not exist'.format(index+1, attribute[1:], value))
+		return errors
+
+	def report_locus(self, label, location, errors):
+
+		"""
+		One aggregated report per failing locus
+		"""
+
+		report = ['CFG: Locus "{}" ({}) failed validation with {} error(s):'.format(label, location, len(errors))]
+		report.extend('    {}'.format(error) for error in errors)
+		log.error('{}{}{}{}'.format(Colour.red,'gtr__ ',Colour.end,'\n'.join(report)))
 
 	def return_dict(self):
 		return self.config_dict
\ No newline at end of file
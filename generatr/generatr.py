@@ -2,87 +2,198 @@
 ## Generic imports
 import os
 import sys
+import json
+import signal
 import argparse
-import tempfile
 import logging as log
-import pkg_resources
-from itertools import product
+from contextlib import contextmanager
 
 ##
 ## Subpackage/s??
 from .dtdvalidate.validation import Colour as clr
-from .dtdvalidate.validation import ConfigReader
+from .api import Generator, ConfigError
+from .dtdvalidate.loaders import loader_for
+from .ordering import ORDERINGS, DEFAULT_ORDERING
+from .planner import parse_size, budget_violations, plan_report
+from .cache import DEFAULT_CACHE_SIZE
+from .shards import SHARD_MODES
+from .metrics import RunMetrics, ProgressDisplay
+from .checkpoint import CheckpointJournal, CheckpointError, RunInterrupted, CHECKPOINT_INTERVAL
 
 class generatr:
 	def __init__(self):
 
 		"""
-		Simple data scraping script which takes a sam file as input
-		and collects the top 3 references in regards to aligned read count.
+		Command line front end to api.Generator
+		Each input XML is generated into its paired output FASTA; in batch mode many
+		configs are processed by the one interpreter and the one (cached) Generator
 		"""
-		##
-		## Package data
-		self.package_exampleXML = pkg_resources.resource_filename(__name__, 'dtdvalidate/example_input.xml')
-		self.package_configDTD = pkg_resources.resource_filename(__name__, 'dtdvalidate/xml_rules.dtd')
 
 		##
 		## Argument parser from CLI
 		self.parser = argparse.ArgumentParser(prog='generatr',description='RefGeneratr: Dynamic multi-loci/mutli-repeat tract microsatellite sequence generator.')
-		self.parser.add_argument('-i','--input',help='Input data. Path to input XML document with desired sequence information.',nargs=1,required=True)
-		self.parser.add_argument('-o','--output',help='Output path. Specify a directory wherein your *.fa reference will be saved.',nargs=1,required=True)
+		self.parser.add_argument('-i','--input',help='Input data. Path to input XML document (or TSV/BED, JSON, JSON lines or YAML locus table) with desired sequence information. Several may be given, paired in order with -o.',nargs='+')
+		self.parser.add_argument('-o','--output',help='Output path. Specify a directory wherein your *.fa reference will be saved. Required unless planning.',nargs='+')
+		self.parser.add_argument('-b','--batch',help='Batch mode. Tab separated file of <input XML> <output FASTA> pairs (one per line, # comments), all generated in this one process.')
 		self.parser.add_argument('-s','--silent',help='Only outputs repeat size on each contig entry in the reference (does not specify repeat unit, integer only)',action='store_true')
+		self.parser.add_argument('-r','--ordering',help='Haplotype ordering within each locus. colexicographic (default): first repeat region varies fastest; lexicographic: last repeat region varies fastest. A loci "ordering" attribute in the XML takes priority.',choices=ORDERINGS,default=DEFAULT_ORDERING)
+		self.parser.add_argument('-j','--jobs',help='Number of worker processes used to generate loci (default 1; 0 uses every available core). Output order is identical regardless.',type=int,default=1)
+		self.parser.add_argument('-z','--bgzip',help='BGZF compress the output FASTA (output path should end in .gz), readable directly by samtools/htslib.',action='store_true')
+		self.parser.add_argument('-x','--index',help='Write the samtools faidx index (.fai, plus .gzi when compressing) alongside the output, during generation.',action='store_true')
+		self.parser.add_argument('-n','--no-validate',help='Trust the input: skip DTD and parameter validation, and do not load lxml. Only for configs which have already been validated.',action='store_true')
+		self.parser.add_argument('-c','--cache',help='Locus cache directory. Loci generated before (same definition and options) are copied from here instead of being regenerated.')
+		self.parser.add_argument('--cache-size',help='Size limit of the locus cache, least recently used loci are evicted beyond it (default 10G).',type=parse_size,default=DEFAULT_CACHE_SIZE)
+		self.parser.add_argument('--shards',help='Split the output into (up to) this many FASTA shards, generated in parallel across --jobs, with a manifest of which shard/offset holds every haplotype.',type=int,default=1)
+		self.parser.add_argument('--shard-by',help='Balance shards by haplotype count (records, default), by size (bytes), or by size without splitting any locus (loci).',choices=SHARD_MODES,default='records')
+		self.parser.add_argument('-l','--lookup',help='Random access. Prints the record for each key to stdout without generating the reference: a haplotype index (0 based, over the whole config), <locus label>:<index>, or a haplotype label such as locus_CAG42_CCG7.',nargs='+')
+		self.parser.add_argument('-p','--plan',help='Dry run. Reports haplotype counts, exact output size, predicted peak memory and runtime per locus, then exits without writing anything.',action='store_true')
+		self.parser.add_argument('--max-records',help='Budget: refuse to generate (warn when planning) if the run would produce more haplotypes than this.',type=int)
+		self.parser.add_argument('--max-bytes',help='Budget: refuse to generate (warn when planning) if the uncompressed output would exceed this size, e.g. 50G.',type=parse_size)
+		self.parser.add_argument('--max-memory',help='Budget: refuse to generate (warn when planning) if predicted peak memory would exceed this size, e.g. 8G.',type=parse_size)
+		self.parser.add_argument('--max-runtime',help='Budget: refuse to generate (warn when planning) if predicted runtime would exceed this many seconds.',type=float)
+		self.parser.add_argument('-P','--progress',help='Live progress on stderr: records, bytes, throughput, ETA, peak memory and current locus (a line every 30s when not a terminal).',action='store_true')
+		self.parser.add_argument('--metrics',help='Write run metrics (stage timings, per locus records/bytes/seconds, throughput, peak memory, progress timeline) to this JSON file.')
+		self.parser.add_argument('-k','--checkpoint',help='Checkpoint plain output every this many seconds (default 60) to a journal beside it, so a killed run can be resumed. SIGTERM/SIGINT stop at a checkpoint.',type=float,nargs='?',const=CHECKPOINT_INTERVAL)
+		self.parser.add_argument('--resume',help='Resume a checkpointed run from its journal, after verifying the output written so far (starts afresh if there is nothing to resume). Implies --checkpoint.',action='store_true')
 		self.parser.add_argument('-v','--verbose',help='Verbose mode. Enables terminal user feedback.',action='store_true')
 		self.args = self.parser.parse_args()
 
 		##
-		## Sets up input directories and verbose mode if requested
-		self.input_directory = self.args.input[0]
-		self.output_directory = self.args.output[0]
-		self.silent_flag = self.args.silent
+		## Sets up options and verbose mode if requested
+		self.plan_flag = self.args.plan
+		self.lookup_keys = self.args.lookup
+		self.metrics_reports = []
+		self.compress_flag = self.args.bgzip
+		self.budgets = {'max_records': self.args.max_records, 'max_bytes': self.args.max_bytes,
+						'max_memory': self.args.max_memory, 'max_runtime': self.args.max_runtime}
 		if self.args.verbose:
 			log.basicConfig(level=log.DEBUG, format="%(message)s")
+		self.generator = Generator(self.args.silent, self.args.ordering, self.args.jobs, self.args.bgzip, self.args.index, not self.args.no_validate,
+								   self.args.cache, self.args.cache_size)
 
 		##
 		## User feedback and run application
-		## Checks for appropriate input/output -- if self.iocheck() returns false, quit
 		log.info('{}{}{}{}{}'.format('\n', clr.bold,'gtr__ ',clr.end,'RefGeneratr: microsatellite reference sequence generator.'))
 		log.info('{}{}{}{}'.format(clr.bold,'gtr__ ',clr.end,'alastair.maxwell@glasgow.ac.uk'))
-		self.input_dictionary = {}
-		if not self.iocheck():
+		run_list = self.collect_runs()
+		if run_list is None:
 			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'Exiting..'))
 			sys.exit(2)
 
 		##
-		## Loop over every loci that we scraped from XML
-		## Extract info and format tailor to generator methods
-		## Save reference string to structure, when all complete, pass to file writer
-		self.temp_loci_files = []
-		for k,v in self.input_dictionary.items():
+		## A failed run is reported and skipped; the remainder of a batch still goes ahead
+		failures = 0
+		for self.input_directory, self.output_directory in run_list:
+			if not self.run():
+				failures += 1
+		if failures:
+			log.error('{}{}{}{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,failures,' of ',len(run_list),' run(s) failed. Exiting..'))
+			sys.exit(2)
+
+	def collect_runs(self):
+
+		"""
+		Pairs up inputs and outputs from -i/-o and/or --batch
+		Returns a list of (input, output) tuples, or None if they do not pair up
+		"""
+
+		inputs = list(self.args.input or [])
+		outputs = list(self.args.output or [])
+		if self.args.batch:
+			with open(self.args.batch, 'r') as batch_file:
+				for line in batch_file:
+					line = line.strip()
+					if not line or line.startswith('#'):
+						continue
+					fields = line.split('\t')
+					inputs.append(fields[0])
+					outputs.append(fields[1] if len(fields) > 1 else None)
+
+		if not inputs:
+			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'I/O: No input specified! (-i or --batch)'))
+			return None
+		if (self.plan_flag or self.lookup_keys) and not outputs:
+			outputs = [None] * len(inputs)
+		if len(inputs) != len(outputs):
+			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'I/O: Every input requires a matching output path!'))
+			return None
+		return list(zip(inputs, outputs))
+
+	def run(self):
+
+		"""
+		Checks, plans (if requested) and generates one input into one output
+		Returns True on success
+		"""
+
+		if not self.iocheck():
+			return False
+		try:
 
 			##
-			## Single Loci mode, structure returned an individual dictionary
-			if type(v) == dict:
-				log.info('{}{}{}{}'.format(clr.bold,'gtr__ ',clr.end,'Detected a single locus. Processing..'))
-				locus_dictionary = self.loci_collector(v)
-				locus_string = self.generate_loci_reference(locus_dictionary)
-				self.temporary_file_creation(locus_string)
-				self.write_output()
+			## Random access; only the requested haplotypes are decoded
+			if self.lookup_keys:
+				return self.lookup_run()
+
 			##
-			## Multi loci mode, structure returned a list of dictionaries
-			if type(v) == list:
-				log.info('{}{}{}{}'.format(clr.bold,'gtr__ ',clr.end,'Detected multiple loci. Processing..'))
-				for raw_locus in v:
-					locus_dictionary = self.loci_collector(raw_locus)
-					locus_string = self.generate_loci_reference(locus_dictionary)
-					self.temporary_file_creation(locus_string)
-				self.write_output()
+			## Instrumentation, if requested, covers the run from here on
+			metrics = None
+			if (self.args.progress or self.args.metrics) and not self.plan_flag:
+				metrics = RunMetrics(self.input_directory, self.output_directory, [ProgressDisplay()] if self.args.progress else [],
+									 per_locus=bool(self.args.metrics))
+
+			##
+			## Dry run and/or budget checks, sized in closed form before anything is written
+			if self.plan_flag or any(budget is not None for budget in self.budgets.values()):
+				if metrics is not None:
+					with metrics.stage('budget'):
+						planned = self.plan_run()
+				else:
+					planned = self.plan_run()
+				if not planned:
+					return False
+				if self.plan_flag:
+					return True
+
+			##
+			## Loci are validated and handed over one at a time as the XML is parsed,
+			## so generation starts as soon as the first <loci> element has been read.
+			## Haplotype records are streamed straight into the output file as they are generated
+			log.info('{}{}{}{}{}'.format(clr.bold,'gtr__ ',clr.end,'Processing loci.. ',self.input_directory))
+			if self.generator.jobs > 1:
+				log.info('{}{}{}{}{}{}'.format(clr.bold,'gtr__ ',clr.end,'Generating across ',self.generator.jobs,' processes..'))
+			journal = None
+			if self.args.checkpoint is not None or self.args.resume:
+				interval = CHECKPOINT_INTERVAL if self.args.checkpoint is None else self.args.checkpoint
+				journal = CheckpointJournal(self.output_directory, self.args.silent, self.args.ordering, interval, self.args.resume)
+			try:
+				with self.stop_signals(journal):
+					written = self.generator.write_output(self.input_directory, self.output_directory, self.args.shards, self.args.shard_by, metrics, journal)
+			finally:
+				if metrics is not None and self.args.metrics:
+					self.write_metrics(metrics)
+			if journal is not None and journal.resumed is not None:
+				log.info('{}{}{}{}{}{}{}{}'.format(clr.bold,'gtr__ ',clr.end,'Resumed from a checkpoint at ',journal.resumed['records'],' records (',journal.resumed['bytes'],' bytes).'))
+			if 'shards' in written:
+				log.info('{}{}{}{}{}{}{}'.format(clr.bold,'gtr__ ',clr.end,len(written['shards']),' shard(s) written, manifest: ',written['manifest'],'.'))
+			if self.generator.cache is not None:
+				log.info('{}{}{}{}{}{}{}{}'.format(clr.bold,'gtr__ ',clr.end,'Locus cache: ',self.generator.cache.hits,' hit(s), ',self.generator.cache.misses,' miss(es).'))
+		except (ConfigError, CheckpointError) as error:
+			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,error))
+			return False
+		except RunInterrupted as error:
+			log.error('{}{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,error,', rerun with --resume.'))
+			return False
+		except OSError as error:
+			log.error('{}{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'I/O: ',error))
+			return False
 
 		log.info('{}{}{}{}'.format(clr.bold,'gtr__ ',clr.end,'Finished processing.'))
+		return True
 
 	def iocheck(self):
 		"""
-		Checks input isfile/isXML;;	Checks exampleXML/DTD validates
-		Checks inputXML validates;; Checks output file
+		Checks input isfile/isConfig;;	Checks output file
 		Return True if all OK, else False
 		"""
 
@@ -91,188 +202,104 @@ class generatr:
 		if not (os.path.isfile(self.input_directory)):
 			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'I/O: Specified input path is not a file!'))
 			return False
-		if not (self.input_directory.endswith('.xml') or self.input_directory.endswith('.XML')):
-			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'I/O: Specified input file is not XML!'))
+		if not (self.input_directory.endswith('.xml') or self.input_directory.endswith('.XML') or loader_for(self.input_directory)):
+			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'I/O: Specified input file is not a supported config (XML, TSV/BED, JSON, JSON lines or YAML)!'))
 			return False
 
 		##
-		## Validate exampleXML, then inputXML against package DTD
-		ConfigReader(self.package_configDTD, self.package_exampleXML)
-		self.input_dictionary = ConfigReader(self.package_configDTD, self.input_directory).return_dict()
+		## Specified output check (nothing is written in --plan or --lookup mode)
+		if self.plan_flag or self.lookup_keys:
+			return True
+		if self.output_directory is None:
+			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'I/O: No output path specified!'))
+			return False
 
 		##
-		## Specified output check
-		if not (self.output_directory.endswith('.fasta') or self.output_directory.endswith('.fa') or self.output_directory.endswith('.fas')):
+		## Compressed output may (and uncompressed output may not) carry a .gz/.bgz suffix
+		fasta_path = self.output_directory
+		compressed_suffix = fasta_path.endswith('.gz') or fasta_path.endswith('.bgz')
+		if compressed_suffix:
+			fasta_path = os.path.splitext(fasta_path)[0]
+		if not (fasta_path.endswith('.fasta') or fasta_path.endswith('.fa') or fasta_path.endswith('.fas')):
 			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'I/O: Specified output path is not targetting a FASTA file!'))
 			return False
+		if compressed_suffix and not self.compress_flag:
+			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'I/O: Specified output path is compressed (.gz/.bgz) but --bgzip was not requested!'))
+			return False
+		if (self.args.checkpoint is not None or self.args.resume) and (self.compress_flag or self.args.index or self.args.shards > 1):
+			log.error('{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'I/O: --checkpoint/--resume need plain output (no --bgzip, --index or --shards)!'))
+			return False
 
 		return True
 
 	@staticmethod
-	def loci_collector(raw_locus):
+	@contextmanager
+	def stop_signals(journal):
 
 		"""
-		Function to extract (now verified) information to pass to cartesian string generator
-		Assuming all information is now valid so no more checks are carried out
-		Not the most efficient way of doing it.. but hey
+		While a checkpointed run is generating, SIGTERM (e.g. a scheduler's pre-emption) and SIGINT
+		ask it to stop at a checkpoint, instead of killing it part way through a record
 		"""
 
-		##
-		## FastA dictates each reference should begin with '>'
-		## So check and adhere if required
-		loci_label = raw_locus['@label']
-		if not loci_label.startswith('>'):
-			loci_label = '>' + loci_label
-
-		##
-		## Flanks to be filled in
-		fiveprime_flank = ''
-		threeprime_flank = ''
-
-		##
-		## Repeat region(s) to be filled in
-		input_repeat_regions = []
-
-		##
-		## Intervening sequence(s) to be filled in
-		intervening_regions = []
-
-		##
-		## Dictionaries for each reference region
-		loci_data = raw_locus['input']
-		for sequence_parameters in loci_data:
-
-			##
-			## Scraping 5' flank
-			if sequence_parameters['@type'] == 'fiveprime':
-				fiveprime_flank = sequence_parameters['@flank']
-
-			##
-			## Scraping 3' flank
-			if sequence_parameters['@type'] == 'threeprime':
-				threeprime_flank = sequence_parameters['@flank']
-
-			##
-			## Scraping repeat regions
-			if sequence_parameters['@type'] == 'repeat_region':
-				current_region = {'unit':sequence_parameters['@unit'],
-								'start':sequence_parameters['@start'],
-								'end':sequence_parameters['@end'],
-								'order':sequence_parameters['@order']}
-				input_repeat_regions.append(current_region)
-
-			##
-			## Scraping intervening regions
-			if sequence_parameters['@type'] == 'intervening':
-				current_interv = {'prior':sequence_parameters['@prior'],
-								  'sequence':sequence_parameters['@sequence']}
-				intervening_regions.append(current_interv)
-
-		locus_dictionary = {'label': loci_label,
-							'5P_flank': fiveprime_flank,
-							'repeat_regions': input_repeat_regions,
-							'intervening_regions': intervening_regions,
-							'3P_flank': threeprime_flank}
+		if journal is None:
+			yield
+			return
+		handled = (signal.SIGTERM, signal.SIGINT)
+		previous = dict((signum, signal.signal(signum, lambda signum, frame: journal.request_stop())) for signum in handled)
+		try:
+			yield
+		finally:
+			for signum in handled:
+				signal.signal(signum, previous[signum])
 
-		return locus_dictionary
+	def write_metrics(self, metrics):
 
-	def generate_loci_reference(self, locus_dictionary):
-
-		##
-		## Parameters for the current locus
-		## that we got passed in locus_dictionary
-		loci_label = locus_dictionary['label']
-		five_prime = locus_dictionary['5P_flank']
-		three_prime = locus_dictionary['3P_flank']
-		repeat_regions = locus_dictionary['repeat_regions']
-		intervening_regions = locus_dictionary['intervening_regions']
-
-		##
-		## Process the explicit ranges for each repeat region
-		possible_ranges = []
-		for region in repeat_regions:
-			region['range'] = range(int(region['start']), int(region['end'])+1)
-			possible_ranges.append(region['range'])
+		"""
+		(Re)writes the --metrics JSON file with every run so far, so a batch can be inspected part way through
+		"""
 
-		##
-		## For each list of label ranges, generate cartesian product
-		## Sort the list into our desired order..
-		## start based on first tuple element
-		## Then, do sorting at each position (inefficient hhhhhehe)
-		s = list(product(*possible_ranges))
-		for i in range(1, len(repeat_regions)):
-			s = sorted(s, key=lambda x:x[i])
-
-		## Now we make the strings
-		## i.e. joining intervening sequence to their preceding repeat region
-		## assuming that intervening's "prior" flag == specified order flag
-		def wedge_intervening(region_order):
-			for section in intervening_regions:
-				if section['prior'] == region_order:
-					return section['sequence']
-			return ''
+		self.metrics_reports.append(metrics.report())
+		with open(self.args.metrics + '.part', 'w') as metrics_file:
+			json.dump({'runs': self.metrics_reports}, metrics_file, indent=2)
+		os.replace(self.args.metrics + '.part', self.args.metrics)
 
-		##
-		## Generation of entire reference string
-		complete_reference_string = ''
-		for range_tuple in s:
-			i = 0
-			nonflank_sequences = ''
-			haplotype_label = ''
+	def lookup_run(self):
 
-			##
-			## For this specific range tuple, how many times do we want the repeat unit to occur?
-			## organise this string with flanks, complete string for this individual 'reference point'
-			for num_times in range_tuple:
-
-				##
-				## Information on reference characteristics
-				repeat_unit = repeat_regions[i]['unit']
-				repeat_order = repeat_regions[i]['order']
-				post_repeatregion = wedge_intervening(repeat_order)
-
-				##
-				## Generating the string as directed
-				repeat_region = repeat_unit * num_times
-				complete_region = '{}{}'.format(repeat_region,post_repeatregion)
-				nonflank_sequences = '{}{}'.format(nonflank_sequences,complete_region)
-
-				##
-				## A label anchor appended to the given label
-				## conveying the specified information for the current reference
-				if not self.silent_flag:
-					haplotype_label += '_' + repeat_unit + str(num_times)
-				else:
-					haplotype_label += '_' + str(num_times)
-				i += 1
+		"""
+		Prints the record of every --lookup key, as it would appear in the reference
+		Returns False if any key does not match a haplotype
+		"""
 
-			##
-			## Combine data, append to entire locus' string
-			reference_label = loci_label + haplotype_label
-			reference_sequence = '{}{}{}'.format(five_prime, nonflank_sequences, three_prime)
-			reference_string = '{}\n{}\n\n'.format(reference_label, reference_sequence)
-			complete_reference_string += reference_string
+		try:
+			records = self.generator.lookup_many(self.input_directory, self.lookup_keys)
+		except LookupError as error:
+			log.error('{}{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'Lookup: ',error.args[0]))
+			return False
+		for label, sequence in records:
+			sys.stdout.write('{}\n{}\n'.format(label, sequence))
+		return True
 
-		return complete_reference_string
+	def plan_run(self):
 
-	def temporary_file_creation(self, locus_string):
+		"""
+		Sizes every locus without generating anything and checks the configured budgets
+		In --plan mode the report is printed and budget violations are warnings,
+		otherwise a violation refuses the run. Returns False if the run should not go ahead.
+		"""
 
-		temp_loci_file = tempfile.NamedTemporaryFile(delete=False)
-		binary_string = locus_string.encode()
-		temp_loci_file.write(binary_string)
-		temp_loci_file.flush()
-		self.temp_loci_files.append(temp_loci_file)
+		log.info('{}{}{}{}'.format(clr.bold,'gtr__ ',clr.end,'Planning..'))
+		plan = self.generator.plan(self.input_directory)
+		violations = budget_violations(plan, **self.budgets)
 
-	def write_output(self):
+		if self.plan_flag:
+			print(plan_report(plan))
+			for violation in violations:
+				log.warning('{}{}{}{}{}'.format(clr.yellow,'gtr__ ',clr.end,'Budget: ',violation))
+			return True
 
-		with open(self.output_directory, 'w') as outfile:
-			for loci in self.temp_loci_files:
-				loci.seek(0)
-				binary_loci = loci.read().decode()
-				outfile.write(binary_loci)
-				outfile.write('\n')
-				loci.close()
-		outfile.close()
+		for violation in violations:
+			log.error('{}{}{}{}{}'.format(clr.red,'gtr__ ',clr.end,'Budget: ',violation))
+		return not violations
 
 def main():
-	generatr()
\ No newline at end of file
+	generatr()
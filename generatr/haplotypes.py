@@ -0,0 +1,105 @@
+##
+## Haplotype record generation for a single locus
+## Kept free of any CLI state so that worker processes can generate slices of a locus
+
+##
+## Subpackage/s??
+from .ordering import DEFAULT_ORDERING
+from .selection import selected_product
+
+def haplotype_records(locus, silent_flag=False, ordering=DEFAULT_ORDERING, start=0, stop=None):
+
+	"""
+	Generator which yields a (label, sequence) record for every haplotype of a locus
+	Nothing is accumulated here; the caller decides where each record goes
+	start/stop restrict generation to a slice [start, stop) of the locus' ordered (selected) product
+	"""
+
+	##
+	## Parameters for the current locus (a model.Locus)
+	loci_label = locus.label
+	five_prime = locus.fiveprime
+	three_prime = locus.threeprime
+
+	##
+	## Cartesian product of the ranges (or the locus' selected subset), yielded lazily in the requested order
+	## A locus-specific ordering from the XML overrides the CLI default
+	ordering = locus.ordering or ordering
+	s = selected_product(locus, ordering, start, stop)
+
+	##
+	## Now we make the strings
+	## Each region already carries the intervening sequence which follows it
+	repeat_units = [region.unit for region in locus.regions]
+	post_repeatregions = [region.intervening for region in locus.regions]
+
+	##
+	## Per-region sequence segments and label anchors for the current tuple
+	## Only regions whose count changed since the previous tuple are rebuilt
+	region_count = len(locus.regions)
+	segments = [''] * region_count
+	label_anchors = [''] * region_count
+
+	##
+	## prefixes[k] == 5' flank + segments[:k], suffixes[k] == segments[k:] + 3' flank
+	## Entries are kept while the regions they cover are unchanged, so consecutive
+	## haplotypes re-use everything either side of the region(s) that actually changed
+	prefixes = [five_prime] + [None] * region_count
+	suffixes = [None] * region_count + [three_prime]
+	prefix_valid = 0
+	suffix_valid = region_count
+
+	##
+	## Generation of the locus' references, one haplotype record at a time
+	previous_tuple = None
+	for range_tuple in s:
+
+		##
+		## Span of regions [low, high] that differ from the previous haplotype
+		if previous_tuple is None:
+			low, high = 0, region_count - 1
+		else:
+			low = 0
+			while low < region_count and range_tuple[low] == previous_tuple[low]:
+				low += 1
+			high = region_count - 1
+			while high > low and range_tuple[high] == previous_tuple[high]:
+				high -= 1
+		previous_tuple = range_tuple
+
+		##
+		## For this specific range tuple, how many times do we want the repeat unit to occur?
+		## A label anchor conveys the specified information for each region
+		for i in range(low, high + 1):
+			num_times = range_tuple[i]
+			segments[i] = repeat_units[i] * num_times + post_repeatregions[i]
+			if not silent_flag:
+				label_anchors[i] = '_' + repeat_units[i] + str(num_times)
+			else:
+				label_anchors[i] = '_' + str(num_times)
+
+		##
+		## Invalidate cached flank-side joins which covered a changed region, then
+		## extend the caches up to the changed span (no-op when already cached)
+		prefix_valid = min(prefix_valid, low)
+		suffix_valid = max(suffix_valid, high + 1)
+		while prefix_valid < low:
+			prefixes[prefix_valid + 1] = prefixes[prefix_valid] + segments[prefix_valid]
+			prefix_valid += 1
+		while suffix_valid > high + 1:
+			suffixes[suffix_valid - 1] = segments[suffix_valid - 1] + suffixes[suffix_valid]
+			suffix_valid -= 1
+
+		##
+		## Combine data, hand this record straight to the caller
+		reference_label = loci_label + ''.join(label_anchors)
+		reference_sequence = prefixes[low] + ''.join(segments[low:high + 1]) + suffixes[high + 1]
+		yield reference_label, reference_sequence
+
+def haplotype_chunk(locus, silent_flag, ordering, start, stop):
+
+	"""
+	Materialises one slice of a locus' records, for shipping back from a worker process
+	"""
+
+	return list(haplotype_records(locus, silent_flag, ordering, start, stop))
@@ -0,0 +1,117 @@
+##
+## Random access to single haplotypes
+## A haplotype is found by its index (decoded mixed-radix over the region ranges) or by its label
+## (parsed back into repeat counts and encoded into an index), straight from the locus definition;
+## nothing else of the locus is generated
+
+##
+## Subpackage/s??
+from .ordering import DEFAULT_ORDERING
+from .haplotypes import haplotype_records
+from .selection import selection_size, selection_index
+
+def record_at(locus, index, silent_flag=False, ordering=DEFAULT_ORDERING):
+
+	"""
+	The (label, sequence) record of haplotype #index (0 based, in output order) of a locus
+	Raises IndexError if the locus has no such haplotype
+	"""
+
+	if index >= 0:
+		for record in haplotype_records(locus, silent_flag, ordering, index, index + 1):
+			return record
+	raise IndexError('Haplotype #{} is outside of locus {} ({} haplotypes)'.format(index, locus.label.lstrip('>'), selection_size(locus)))
+
+def parse_label(locus, label, silent_flag=False):
+
+	"""
+	Repeat counts encoded in a haplotype label of this locus, e.g. locus_CAG42_CCG7 -> (42, 7)
+	('_42_7' in silent mode); None if the label does not belong to the locus
+	"""
+
+	label = '>' + label.lstrip('>')
+	if not label.startswith(locus.label):
+		return None
+	remainder = label[len(locus.label):]
+	counts = []
+	for region in locus.regions:
+		anchor = '_' if silent_flag else '_' + region.unit
+		if not remainder.startswith(anchor):
+			return None
+		remainder = remainder[len(anchor):]
+		digits = len(remainder) - len(remainder.lstrip('0123456789'))
+		if not digits:
+			return None
+		counts.append(int(remainder[:digits]))
+		remainder = remainder[digits:]
+	if remainder:
+		return None
+	return tuple(counts)
+
+def locus_index(locus, label, silent_flag=False, ordering=DEFAULT_ORDERING):
+
+	"""
+	Index of a labelled haplotype within its locus, or None if it is not one of the locus' haplotypes
+	"""
+
+	counts = parse_label(locus, label, silent_flag)
+	if counts is None:
+		return None
+	try:
+		return selection_index(locus, counts, locus.ordering or ordering)
+	except ValueError:
+		return None
+
+def lookup_records(loci, keys, silent_flag=False, ordering=DEFAULT_ORDERING):
+
+	"""
+	Records for each key, in key order. A key is an integer (haplotype index over every locus,
+	in output order), '<locus label>:<index>' (index within that locus) or a haplotype label.
+	Loci are read once, and only as far as needed; raises IndexError/KeyError for a missing key
+	"""
+
+	loci_seen = []
+	loci = iter(loci)
+
+	def each_locus():
+		for locus in loci_seen:
+			yield locus
+		for locus in loci:
+			loci_seen.append(locus)
+			yield locus
+
+	records = []
+	for key in keys:
+		record = None
+
+		##
+		## Index over the whole config
+		if isinstance(key, int) or str(key).isdigit():
+			index = int(key)
+			for locus in each_locus():
+				haplotypes = selection_size(locus)
+				if index < haplotypes:
+					record = record_at(locus, index, silent_flag, ordering)
+					break
+				index -= haplotypes
+			if record is None:
+				raise IndexError('Haplotype #{} is outside of the config'.format(key))
+			records.append(record)
+			continue
+
+		##
+		## Index within a locus, or a haplotype label
+		locus_label, separator, index = key.rpartition(':')
+		for locus in each_locus():
+			if separator and index.isdigit() and locus.label.lstrip('>') == locus_label.lstrip('>'):
+				record = record_at(locus, int(index), silent_flag, ordering)
+				break
+			index_in_locus = locus_index(locus, key, silent_flag, ordering)
+			if index_in_locus is not None:
+				record = record_at(locus, index_in_locus, silent_flag, ordering)
+				break
+		if record is None:
+			raise KeyError('No haplotype matches "{}"'.format(key))
+		records.append(record)
+
+	return records
@@ -0,0 +1,266 @@
+##
+## Run instrumentation
+## Stage and per-locus hooks are called by api.Generator; records/bytes written are sampled from the
+## writer by a background thread, so nothing is added to the per-record hot loop. Listeners (e.g. the
+## live ProgressDisplay) are handed a snapshot on every sample; the whole run can be dumped as JSON.
+
+##
+## Generic imports
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+##
+## Subpackage/s??
+from .planner import format_size, format_duration, peak_rss
+
+##
+## Seconds between samples of the writer, and between timeline entries kept for the metrics file
+SAMPLE_INTERVAL = 0.5
+TIMELINE_INTERVAL = 10.0
+
+##
+## Per locus measurements are kept as tuples of these, and reported as dictionaries
+LOCUS_FIELDS = ('label', 'records', 'bytes', 'seconds', 'cached')
+
+def peak_memory():
+
+	"""
+	Peak resident set size (bytes) of this process and of its (finished) worker processes; None where unavailable
+	"""
+
+	return peak_rss(), peak_rss(children=True)
+
+class RunMetrics(object):
+
+	"""
+	Metrics of one generation run: stage durations, per locus records/bytes/seconds,
+	throughput, ETA against the expected (planned) totals, and peak memory
+	per_locus=False drops the per locus breakdown (e.g. for live progress only), so a config of
+	any number of loci is measured in constant memory
+	"""
+
+	def __init__(self, input_path=None, output_path=None, listeners=(), sample_interval=SAMPLE_INTERVAL, per_locus=True):
+
+		##
+		## Instance variables
+		self.input_path = input_path
+		self.output_path = output_path
+		self.listeners = list(listeners)
+		self.sample_interval = sample_interval
+		self.per_locus = per_locus
+		self.started = time.time()
+		self.clock = time.perf_counter()
+		self.stages = {}
+		self.loci = []
+		self.timeline = []
+		self.expected_records = None
+		self.expected_bytes = None
+		self.records = 0
+		self.bytes = 0
+		self.resumed = (0, 0)
+		self.current_locus = None
+		self.locus_started = None
+		self.locus_offset = (0, 0)
+		self.finished = None
+		self.completed = False
+
+	def elapsed(self):
+		return (self.finished or time.perf_counter()) - self.clock
+
+	@contextmanager
+	def stage(self, name):
+
+		"""
+		Times a pipeline stage (parse, plan, generate, finalise ..); repeated stages accumulate
+		"""
+
+		started = time.perf_counter()
+		try:
+			yield self
+		finally:
+			self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+	def expect(self, records, output_bytes):
+
+		##
+		## Planned totals, from the closed form sizes; the basis of progress and ETA
+		self.expected_records = records
+		self.expected_bytes = output_bytes
+
+	def resume(self, records, output_bytes):
+
+		##
+		## Output already written by an earlier (checkpointed) run: counted in the totals and progress,
+		## but not in this run's throughput or ETA
+		self.resumed = (records, output_bytes)
+		self.update(records, output_bytes)
+
+	def start_locus(self, label, records, output_bytes):
+
+		self.current_locus = label
+		self.locus_started = time.perf_counter()
+		self.locus_offset = (records, output_bytes)
+
+	def end_locus(self, records, output_bytes, cached=False):
+
+		self.update(records, output_bytes)
+		if self.per_locus:
+			self.loci.append((self.current_locus.lstrip('>'), records - self.locus_offset[0], output_bytes - self.locus_offset[1],
+							  time.perf_counter() - self.locus_started, cached))
+		self.current_locus = None
+
+	def update(self, records, output_bytes):
+		self.records, self.bytes = records, output_bytes
+
+	def snapshot(self):
+
+		"""
+		Current progress: counts, throughput, fraction done, ETA (None until known) and peak memory
+		Throughput and ETA are of this run's output, so exclude any resumed from
+		"""
+
+		elapsed = self.elapsed()
+		rss, rss_children = peak_memory()
+		records_written = self.records - self.resumed[0]
+		bytes_written = self.bytes - self.resumed[1]
+		state = {'elapsed': elapsed,
+				 'records': self.records,
+				 'bytes': self.bytes,
+				 'records_per_second': records_written / elapsed if elapsed else 0.0,
+				 'bytes_per_second': bytes_written / elapsed if elapsed else 0.0,
+				 'expected_records': self.expected_records,
+				 'expected_bytes': self.expected_bytes,
+				 'fraction': None,
+				 'eta': None,
+				 'locus': self.current_locus.lstrip('>') if self.current_locus else None,
+				 'peak_rss': rss,
+				 'peak_rss_children': rss_children}
+		if self.expected_bytes:
+			state['fraction'] = min(1.0, float(self.bytes) / self.expected_bytes)
+			if bytes_written:
+				state['eta'] = max(0.0, (self.expected_bytes - self.bytes) / state['bytes_per_second'])
+		return state
+
+	def sample(self):
+
+		state = self.snapshot()
+		if not self.timeline or state['elapsed'] - self.timeline[-1][0] >= TIMELINE_INTERVAL:
+			self.timeline.append([round(state['elapsed'], 3), state['records'], state['bytes']])
+		for listener in self.listeners:
+			listener.progress(state)
+		return state
+
+	@contextmanager
+	def watch(self, source):
+
+		"""
+		Samples source() -> (records, bytes) in the background until the block exits
+		"""
+
+		stopped = threading.Event()
+
+		def poll():
+			while not stopped.wait(self.sample_interval):
+				self.update(*source())
+				self.sample()
+
+		poller = threading.Thread(target=poll, name='generatr-metrics', daemon=True)
+		poller.start()
+		try:
+			yield self
+		finally:
+			stopped.set()
+			poller.join()
+			self.update(*source())
+			self.sample()
+
+	def finish(self, completed=True):
+
+		self.completed = completed
+		self.finished = time.perf_counter()
+		state = self.sample()
+		for listener in self.listeners:
+			listener.finish(state)
+
+	def report(self):
+
+		"""
+		Everything measured, as a JSON serialisable dictionary
+		"""
+
+		state = self.snapshot()
+		return {'input': self.input_path,
+				'output': self.output_path,
+				'completed': self.completed,
+				'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+				'elapsed': state['elapsed'],
+				'records': self.records,
+				'bytes': self.bytes,
+				'expected_records': self.expected_records,
+				'expected_bytes': self.expected_bytes,
+				'resumed_records': self.resumed[0],
+				'resumed_bytes': self.resumed[1],
+				'records_per_second': state['records_per_second'],
+				'bytes_per_second': state['bytes_per_second'],
+				'peak_rss': state['peak_rss'],
+				'peak_rss_children': state['peak_rss_children'],
+				'stages': dict(self.stages),
+				'loci': [dict(zip(LOCUS_FIELDS, locus)) for locus in self.loci],
+				'timeline': list(self.timeline)}
+
+class ProgressDisplay(object):
+
+	"""
+	Live, single line progress on a terminal (redrawn in place); on anything else,
+	e.g. a scheduler's log file, a plain line every log_interval seconds
+	"""
+
+	def __init__(self, stream=None, log_interval=30.0):
+
+		self.stream = stream or sys.stderr
+		self.interactive = hasattr(self.stream, 'isatty') and self.stream.isatty()
+		self.log_interval = log_interval
+		self.last_line = 0.0
+		self.width = 0
+
+	def render(self, state):
+
+		fields = []
+		if state['fraction'] is not None:
+			fields.append('{:5.1f}%'.format(state['fraction'] * 100))
+		if state['expected_records'] is not None:
+			fields.append('{}/{} records'.format(state['records'], state['expected_records']))
+		else:
+			fields.append('{} records'.format(state['records']))
+		fields.append(format_size(state['bytes']))
+		fields.append('{}/s'.format(format_size(state['bytes_per_second'])))
+		fields.append('elapsed {}'.format(format_duration(state['elapsed'])))
+		if state['eta'] is not None:
+			fields.append('ETA {}'.format(format_duration(state['eta'])))
+		if state['peak_rss'] is not None:
+			fields.append('RSS {}'.format(format_size(state['peak_rss'])))
+		if state['locus']:
+			fields.append(state['locus'])
+		return 'gtr__ ' + '  '.join(fields)
+
+	def progress(self, state):
+
+		if self.interactive:
+			line = self.render(state)
+			self.stream.write('\r' + line.ljust(self.width))
+			self.width = len(line)
+			self.stream.flush()
+		elif state['elapsed'] - self.last_line >= self.log_interval:
+			self.last_line = state['elapsed']
+			self.stream.write(self.render(state) + '\n')
+			self.stream.flush()
+
+	def finish(self, state):
+
+		if self.interactive:
+			self.stream.write('\r' + self.render(state).ljust(self.width) + '\n')
+		else:
+			self.stream.write(self.render(state) + '\n')
+		self.stream.flush()
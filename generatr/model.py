@@ -0,0 +1,171 @@
+##
+## Compact, immutable locus model shared by the config reader, planner and generator
+## Integer fields are parsed once and intervening sequences are attached to the region they follow,
+## so nothing in the generation hot loop looks up dictionaries or converts strings
+
+##
+## Constraint relations: less than, less or equal, equal, greater or equal, greater than
+RELATIONS = ('lt', 'le', 'eq', 'ge', 'gt')
+
+class Region(object):
+
+	"""
+	One repeat region: unit repeated start..end times (every step-th count), followed by
+	its intervening sequence ('' if none)
+	"""
+
+	__slots__ = ('unit', 'start', 'end', 'order', 'intervening', 'step', 'range')
+
+	def __init__(self, unit, start, end, order, intervening='', step=1):
+
+		object.__setattr__(self, 'unit', unit)
+		object.__setattr__(self, 'start', int(start))
+		object.__setattr__(self, 'end', int(end))
+		object.__setattr__(self, 'order', int(order))
+		object.__setattr__(self, 'intervening', intervening)
+		object.__setattr__(self, 'step', int(step))
+		if self.step < 1:
+			raise ValueError('Repeat region step must be a positive integer, got {}'.format(step))
+		object.__setattr__(self, 'range', range(self.start, self.end+1, self.step))
+
+	def __setattr__(self, name, value):
+		raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+	def __reduce__(self):
+		return (Region, (self.unit, self.start, self.end, self.order, self.intervening, self.step))
+
+	def __eq__(self, other):
+		return type(other) is Region and self.__reduce__() == other.__reduce__()
+
+	def __hash__(self):
+		return hash(self.__reduce__()[1])
+
+	def __repr__(self):
+		return 'Region(unit={!r}, start={}, end={}, order={}, intervening={!r}, step={})'.format(self.unit, self.start, self.end, self.order, self.intervening, self.step)
+
+class Constraint(object):
+
+	"""
+	A relation between the repeat counts of two regions (referred to by their order):
+	count(first) <relation> count(second) + offset, relation being one of RELATIONS
+	"""
+
+	__slots__ = ('first', 'relation', 'second', 'offset')
+
+	def __init__(self, first, relation, second, offset=0):
+
+		if relation not in RELATIONS:
+			raise ValueError('Unknown constraint relation: {}'.format(relation))
+		object.__setattr__(self, 'first', int(first))
+		object.__setattr__(self, 'relation', relation)
+		object.__setattr__(self, 'second', int(second))
+		object.__setattr__(self, 'offset', int(offset))
+
+	def __setattr__(self, name, value):
+		raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+	def __reduce__(self):
+		return (Constraint, (self.first, self.relation, self.second, self.offset))
+
+	def __eq__(self, other):
+		return type(other) is Constraint and self.__reduce__() == other.__reduce__()
+
+	def __hash__(self):
+		return hash(self.__reduce__()[1])
+
+	def __repr__(self):
+		return 'Constraint(first={}, relation={!r}, second={}, offset={})'.format(self.first, self.relation, self.second, self.offset)
+
+class Locus(object):
+
+	"""
+	One locus: label (FASTA '>' included), flanks, repeat regions in sequence order,
+	and an optional locus-specific haplotype ordering
+	Haplotypes may be restricted to a subset of the product (see selection.py): by
+	constraints between regions, a window on the sequence length (min_length/max_length),
+	and/or a seeded random sample of at most sample haplotypes
+	"""
+
+	__slots__ = ('label', 'fiveprime', 'threeprime', 'regions', 'ordering', 'ranges',
+				 'constraints', 'min_length', 'max_length', 'sample', 'seed')
+
+	def __init__(self, label, fiveprime='', threeprime='', regions=(), ordering=None,
+				 constraints=(), min_length=None, max_length=None, sample=None, seed=None):
+
+		##
+		## FastA dictates each reference should begin with '>'
+		## So check and adhere if required
+		if not label.startswith('>'):
+			label = '>' + label
+		object.__setattr__(self, 'label', label)
+		object.__setattr__(self, 'fiveprime', fiveprime)
+		object.__setattr__(self, 'threeprime', threeprime)
+		object.__setattr__(self, 'regions', tuple(regions))
+		object.__setattr__(self, 'ordering', ordering)
+		object.__setattr__(self, 'ranges', tuple(region.range for region in self.regions))
+
+		##
+		## Subset selection; constraints must refer to existing repeat regions
+		object.__setattr__(self, 'constraints', tuple(constraints))
+		object.__setattr__(self, 'min_length', None if min_length is None else int(min_length))
+		object.__setattr__(self, 'max_length', None if max_length is None else int(max_length))
+		object.__setattr__(self, 'sample', None if sample is None else int(sample))
+		object.__setattr__(self, 'seed', None if seed is None else int(seed))
+		orders = set(region.order for region in self.regions)
+		for constraint in self.constraints:
+			if constraint.first not in orders or constraint.second not in orders:
+				raise ValueError('{!r} refers to a repeat region which does not exist'.format(constraint))
+
+	def __setattr__(self, name, value):
+		raise AttributeError('{} is immutable'.format(type(self).__name__))
+
+	def __reduce__(self):
+		return (Locus, (self.label, self.fiveprime, self.threeprime, self.regions, self.ordering,
+						self.constraints, self.min_length, self.max_length, self.sample, self.seed))
+
+	def __eq__(self, other):
+		return type(other) is Locus and self.__reduce__() == other.__reduce__()
+
+	def __hash__(self):
+		return hash(self.__reduce__()[1])
+
+	def __repr__(self):
+		return 'Locus(label={!r}, regions={})'.format(self.label, len(self.regions))
+
+	@classmethod
+	def from_raw(cls, raw_locus):
+
+		"""
+		Builds a Locus from a (validated) raw locus, as read from the config:
+		{'@label': .., 'input': [{'@type': .., ..}, ..]}
+		Later flanks replace earlier ones; an intervening sequence is attached to the
+		repeat region whose order matches its prior (first match wins)
+		"""
+
+		fiveprime_flank = ''
+		threeprime_flank = ''
+		repeat_parameters = []
+		intervening_map = {}
+		constraints = []
+		for sequence_parameters in raw_locus['input']:
+			param_type = sequence_parameters['@type']
+			if param_type == 'fiveprime':
+				fiveprime_flank = sequence_parameters['@flank']
+			if param_type == 'threeprime':
+				threeprime_flank = sequence_parameters['@flank']
+			if param_type == 'repeat_region':
+				repeat_parameters.append(sequence_parameters)
+			if param_type == 'intervening':
+				intervening_map.setdefault(int(sequence_parameters['@prior']), sequence_parameters['@sequence'])
+			if param_type == 'constraint':
+				constraints.append(Constraint(sequence_parameters['@first'], sequence_parameters['@relation'],
+											  sequence_parameters['@second'], sequence_parameters.get('@offset', 0)))
+
+		regions = []
+		for sequence_parameters in repeat_parameters:
+			order = int(sequence_parameters['@order'])
+			regions.append(Region(sequence_parameters['@unit'], sequence_parameters['@start'], sequence_parameters['@end'],
+								  order, intervening_map.get(order, ''), sequence_parameters.get('@step', 1)))
+
+		return cls(raw_locus['@label'], fiveprime_flank, threeprime_flank, regions, raw_locus.get('@ordering'), constraints,
+				   raw_locus.get('@min_length'), raw_locus.get('@max_length'), raw_locus.get('@sample'), raw_locus.get('@seed'))
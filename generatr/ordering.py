@@ -0,0 +1,136 @@
+##
+## Ordering engine for the cartesian product of repeat region ranges
+## Tuples are yielded lazily, already in their final order -- nothing is materialised or sorted
+
+##
+## colexicographic: the last repeat region varies slowest, the first region fastest
+## i.e. CAG1_CCG1, CAG2_CCG1, CAG3_CCG1 .. CAG1_CCG2 (the historic generatr order)
+## lexicographic: the first repeat region varies slowest, the last region fastest
+## i.e. CAG1_CCG1, CAG1_CCG2, CAG1_CCG3 .. CAG2_CCG1
+ORDERINGS = ('colexicographic', 'lexicographic')
+DEFAULT_ORDERING = 'colexicographic'
+
+def significance(region_count, ordering=DEFAULT_ORDERING):
+
+	"""
+	Returns the positional indices of the repeat regions,
+	from the slowest varying (most significant) to the fastest varying
+	"""
+
+	if ordering == 'colexicographic':
+		return list(range(region_count-1, -1, -1))
+	if ordering == 'lexicographic':
+		return list(range(region_count))
+	raise ValueError('Unknown haplotype ordering: {}'.format(ordering))
+
+def product_size(ranges):
+
+	"""
+	Number of tuples in the cartesian product of ranges (without enumerating them)
+	"""
+
+	size = 1
+	for region_range in ranges:
+		size *= len(region_range)
+	return size
+
+def count_below(region_range, value):
+
+	"""
+	Number of values of an ascending range which are less than value
+	"""
+
+	if not len(region_range) or value <= region_range[0]:
+		return 0
+	return min(len(region_range), -(-(value - region_range[0]) // region_range.step))
+
+def unrank(ranges, index, ordering=DEFAULT_ORDERING):
+
+	"""
+	Mixed-radix decoding of a position in the ordered product into the
+	per-region positions (indices into each range) of the tuple found there
+	"""
+
+	ranges = list(ranges)
+	positions = [0] * len(ranges)
+	for position in reversed(significance(len(ranges), ordering)):
+		index, positions[position] = divmod(index, len(ranges[position]))
+	if index:
+		raise IndexError('Haplotype index is outside of the product space')
+	return positions
+
+def rank(ranges, positions, ordering=DEFAULT_ORDERING):
+
+	"""
+	Inverse of unrank: mixed-radix encoding of per-region positions into the index
+	of their tuple in the ordered product
+	"""
+
+	ranges = list(ranges)
+	index = 0
+	for position in significance(len(ranges), ordering):
+		index = index * len(ranges[position]) + positions[position]
+	return index
+
+def ordered_product(ranges, ordering=DEFAULT_ORDERING, start=0, stop=None):
+
+	"""
+	Odometer-style cartesian product of ranges.
+	Tuples are positional (one count per repeat region, in region order), but are
+	yielded in the requested ordering; the fastest region is a tight inner loop,
+	slower regions only tick over once the faster ones have wrapped around.
+	start/stop select a contiguous slice [start, stop) of the ordered product,
+	so disjoint slices can be generated independently of one another.
+	"""
+
+	ranges = list(ranges)
+	total = product_size(ranges)
+	if stop is None or stop > total:
+		stop = total
+	remaining = stop - start
+	if remaining <= 0:
+		return
+	if not ranges:
+		yield ()
+		return
+
+	##
+	## Slowest -> fastest regions; the fastest is handled by the inner loop
+	levels = significance(len(ranges), ordering)
+	outer_levels = levels[:-1]
+	inner_position = levels[-1]
+	inner_range = ranges[inner_position]
+
+	##
+	## Prime the odometer at the tuple found at index start
+	## Each outer iterator holds the values still to come for its region
+	start_positions = unrank(ranges, start, ordering)
+	current = [ranges[position][start_positions[position]] for position in range(len(ranges))]
+	iterators = [iter(ranges[position][start_positions[position]+1:]) for position in outer_levels]
+	inner_values = inner_range[start_positions[inner_position]:]
+
+	while True:
+		if len(inner_values) > remaining:
+			inner_values = inner_values[:remaining]
+		for value in inner_values:
+			current[inner_position] = value
+			yield tuple(current)
+		remaining -= len(inner_values)
+		if not remaining:
+			return
+		inner_values = inner_range
+
+		##
+		## Inner region wrapped; tick over the next slowest region(s)
+		depth = len(outer_levels) - 1
+		while depth >= 0:
+			position = outer_levels[depth]
+			value = next(iterators[depth], None)
+			if value is not None:
+				current[position] = value
+				break
+			iterators[depth] = iter(ranges[position])
+			current[position] = next(iterators[depth])
+			depth -= 1
+		if depth < 0:
+			return
@@ -0,0 +1,187 @@
+##
+## Generic imports
+import io
+import os
+
+##
+## Subpackage/s??
+from .bgzf import BgzfWriter
+
+##
+## Cached blocks are copied into the output in chunks of this size
+SPLICE_CHUNK = 1024*1024
+
+def format_record(label, sequence):
+
+	"""
+	A haplotype record as written: label line, sequence line, blank separator
+	Returns (record bytes, offset of the sequence within the record)
+	"""
+
+	label_bytes = label.encode()
+	return b'%s\n%s\n\n' % (label_bytes, sequence.encode()), len(label_bytes) + 1
+
+def fai_name(label):
+
+	"""
+	Sequence name as samtools sees it: the first word of the label, without '>'
+	"""
+
+	return label.lstrip('>').split(None, 1)[0]
+
+class FastaWriter(object):
+
+	"""
+	Buffered FASTA output sink.
+	Haplotype records are written straight to the output file as they are generated,
+	so memory use does not grow with the number of records in a locus. Output is spooled
+	through a bounded buffer into a '.part' file next to the target, which is atomically
+	renamed into place on success and removed on failure -- a run never leaves a
+	truncated FASTA behind under the requested name.
+	Optionally the output is BGZF compressed, and the samtools .fai (plus .gzi for BGZF)
+	index is written alongside, from offsets tracked while the records are produced.
+	A checkpointed run (see checkpoint.CheckpointJournal) keeps its '.part' file on failure
+	(keep_partial), and is resumed by re-opening it at a verified (records, bytes) position (resume_at).
+	"""
+
+	def __init__(self, output_path, compress=False, index=False, buffer_size=io.DEFAULT_BUFFER_SIZE*64, keep_partial=False, resume_at=None):
+
+		##
+		## Instance variables
+		self.output_path = output_path
+		self.compress = compress
+		self.index = index
+		self.buffer_size = buffer_size
+		self.keep_partial = keep_partial
+		self.records_written = 0
+		self.bytes_written = 0
+
+		##
+		## Target file, plus sidecar indexes if requested; all written as '.part' until complete
+		self.targets = [output_path]
+		if self.index:
+			self.targets.append(output_path + '.fai')
+			if self.compress:
+				self.targets.append(output_path + '.gzi')
+		self.partial_path = output_path + '.part'
+		if resume_at is None:
+			self.handle = open(self.partial_path, 'wb', buffering=self.buffer_size)
+		else:
+			##
+			## Plain output only: anything past the verified prefix is cut off, and writing carries on from there
+			if self.compress or self.index:
+				raise ValueError('Only plain (uncompressed, unindexed) output can be resumed')
+			self.records_written, self.bytes_written = resume_at
+			self.handle = open(self.partial_path, 'r+b', buffering=self.buffer_size)
+			self.handle.truncate(self.bytes_written)
+			self.handle.seek(self.bytes_written)
+		self.outfile = BgzfWriter(self.handle) if self.compress else self.handle
+		self.index_file = None
+		if self.index:
+			self.index_file = open(self.targets[1] + '.part', 'w', buffering=self.buffer_size)
+
+	def write_record(self, label, sequence):
+
+		"""
+		Writes a single haplotype record: label line, sequence line, blank separator
+		"""
+
+		record_bytes, sequence_offset = format_record(label, sequence)
+		self.outfile.write(record_bytes)
+		if self.index_file is not None:
+			self.index_entry(fai_name(label), len(sequence), self.bytes_written + sequence_offset)
+		self.records_written += 1
+		self.bytes_written += len(record_bytes)
+
+	def index_entry(self, name, length, sequence_offset):
+
+		##
+		## faidx entry: name, length, sequence offset, bases/line, bytes/line (one line per sequence)
+		## Offsets are in uncompressed coordinates, as samtools expects for BGZF too
+		self.index_file.write('{}\t{}\t{}\t{}\t{}\n'.format(name, length, sequence_offset, length, length + 1))
+
+	def write_records(self, records):
+
+		"""
+		Consumes an iterable of (label, sequence) tuples, one record at a time
+		"""
+
+		for label, sequence in records:
+			self.write_record(label, sequence)
+
+	def splice(self, block_file, block_index):
+
+		"""
+		Copies a block of already formatted records (e.g. from the locus cache) into the output
+		block_index yields (name, length, sequence offset within the block) per record
+		"""
+
+		block_start = self.bytes_written
+		for chunk in iter(lambda: block_file.read(SPLICE_CHUNK), b''):
+			self.outfile.write(chunk)
+			self.bytes_written += len(chunk)
+		for name, length, sequence_offset in block_index:
+			if self.index_file is not None:
+				self.index_entry(name, length, block_start + sequence_offset)
+			self.records_written += 1
+
+	def end_locus(self):
+
+		##
+		## Each locus block is terminated by an additional newline
+		self.outfile.write(b'\n')
+		self.bytes_written += 1
+
+	def sync(self):
+
+		##
+		## Everything counted so far is on disk (uncompressed output), e.g. before a checkpoint
+		self.handle.flush()
+		os.fsync(self.handle.fileno())
+
+	def close(self):
+
+		"""
+		Flushes everything to disk, then renames the partial file(s) over the target(s)
+		"""
+
+		if self.handle.closed:
+			return
+		if self.compress:
+			self.outfile.finish()
+		self.handle.flush()
+		os.fsync(self.handle.fileno())
+		self.handle.close()
+		if self.index_file is not None:
+			self.index_file.close()
+			if self.compress:
+				self.outfile.write_gzi(self.targets[2] + '.part')
+		for target in self.targets:
+			os.replace(target + '.part', target)
+
+	def discard(self):
+
+		"""
+		Abandons the output; partial files are removed (kept with keep_partial, to be resumed)
+		and any existing targets are left untouched
+		"""
+
+		if not self.handle.closed:
+			self.handle.close()
+		if self.index_file is not None and not self.index_file.closed:
+			self.index_file.close()
+		if self.keep_partial:
+			return
+		for target in self.targets:
+			if os.path.exists(target + '.part'):
+				os.remove(target + '.part')
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		else:
+			self.discard()
+		return False
@@ -0,0 +1,86 @@
+##
+## Generic imports
+import os
+from collections import deque
+
+##
+## Subpackage/s??
+from .selection import selection_size
+from .haplotypes import haplotype_chunk
+from .planner import max_record_bytes
+
+##
+## Records per task shipped to a worker process
+## Large loci are split into contiguous slices of their ordered product of up to CHUNK_RECORDS records,
+## fewer where records are large, so that no slice holds much more than TARGET_SLICE_BYTES of output
+CHUNK_RECORDS = 20000
+TARGET_SLICE_BYTES = 4*1024*1024
+
+def resolve_jobs(jobs):
+
+	"""
+	--jobs 0 means one worker per available core
+	"""
+
+	if jobs < 1:
+		return os.cpu_count() or 1
+	return jobs
+
+def slice_records(locus, silent_flag=False):
+
+	"""
+	Records per slice of a locus, sized from its largest record
+	"""
+
+	return max(1, min(CHUNK_RECORDS, TARGET_SLICE_BYTES // max(1, max_record_bytes(locus, silent_flag))))
+
+def locus_tasks(loci, chunk_records=None, skip=None, first_start=0, silent_flag=False):
+
+	"""
+	Splits every locus into contiguous [start, stop) slices of its ordered (selected) product,
+	of chunk_records records each (by default sized per locus, see slice_records)
+	Yields (locus, start, stop, final_slice) in output order; loci for which skip(locus)
+	is true are not split, but passed through as a single (locus, None, None, True)
+	The first locus starts at first_start (a run resumed part way through it), and is never skipped
+	"""
+
+	for locus in loci:
+		locus_start, first_start = first_start, 0
+		if skip is not None and not locus_start and skip(locus):
+			yield locus, None, None, True
+			continue
+		total = selection_size(locus)
+		if locus_start >= total:
+			yield locus, total, total, True
+			continue
+		locus_chunk = chunk_records or slice_records(locus, silent_flag)
+		for start in range(locus_start, total, locus_chunk):
+			stop = min(start + locus_chunk, total)
+			yield locus, start, stop, stop == total
+
+def parallel_records(loci, jobs, silent_flag, ordering, chunk_records=None, skip=None, first_start=0):
+
+	"""
+	Generates loci across a process pool, yielding (locus, records, locus_complete) per slice.
+	Slices are collected strictly in submission order, so the output is identical to
+	a single process run. At most 2 * jobs slices, each of about TARGET_SLICE_BYTES at
+	most, are in flight, which bounds memory even when the writer falls behind the workers. Skipped loci (see locus_tasks) are
+	yielded in their place in the order with records of None, for the caller to fill in.
+	first_start is as for locus_tasks.
+	"""
+
+	from concurrent.futures import ProcessPoolExecutor
+	window = jobs * 2
+	pending = deque()
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		for locus, start, stop, final_slice in locus_tasks(loci, chunk_records, skip, first_start, silent_flag):
+			if len(pending) >= window:
+				locus_pending, future, complete = pending.popleft()
+				yield locus_pending, future.result() if future is not None else None, complete
+			future = None
+			if start is not None:
+				future = executor.submit(haplotype_chunk, locus, silent_flag, ordering, start, stop)
+			pending.append((locus, future, final_slice))
+		while pending:
+			locus_pending, future, complete = pending.popleft()
+			yield locus_pending, future.result() if future is not None else None, complete
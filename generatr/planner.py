@@ -0,0 +1,249 @@
+##
+## Generic imports
+import io
+import sys
+import time
+
+##
+## Subpackage/s??
+from .ordering import DEFAULT_ORDERING, count_below
+from .haplotypes import haplotype_records
+from .selection import is_selective, selection_size, selection_blocks, selected_product
+
+##
+## Runtime is predicted from a short calibration run over the largest locus
+CALIBRATION_RECORDS = 2000
+WRITER_BUFFER = io.DEFAULT_BUFFER_SIZE*64
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
+##
+## Interpreter footprint assumed where the platform cannot report peak memory
+INTERPRETER_MEMORY = 32 * 1024**2
+
+def peak_rss(children=False):
+
+	"""
+	Peak resident set size (bytes) of this process, or of its finished child processes
+	None where it cannot be measured (no resource module, i.e. Windows); ru_maxrss is KiB on Linux but bytes on macOS
+	"""
+
+	try:
+		import resource
+	except ImportError:
+		return None
+	maxrss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+	return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+def parse_size(value):
+
+	"""
+	argparse type for byte budgets: plain integers, or with a K/M/G/T suffix
+	"""
+
+	value = value.strip().upper().rstrip('B')
+	multiplier = 1
+	if value and value[-1] in SIZE_SUFFIXES:
+		multiplier = SIZE_SUFFIXES[value[-1]]
+		value = value[:-1]
+	return int(float(value) * multiplier)
+
+def format_size(size):
+
+	for suffix in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+		if size < 1024 or suffix == 'TiB':
+			break
+		size /= 1024.0
+	return '{:.1f} {}'.format(size, suffix) if suffix != 'B' else '{} B'.format(int(size))
+
+def format_duration(seconds):
+
+	minutes, seconds = divmod(int(round(seconds)), 60)
+	hours, minutes = divmod(minutes, 60)
+	return '{}h{:02d}m{:02d}s'.format(hours, minutes, seconds)
+
+def range_sum(region_range):
+
+	"""
+	Sum of the values of a range (arithmetic series)
+	"""
+
+	if not len(region_range):
+		return 0
+	return len(region_range) * (region_range[0] + region_range[-1]) // 2
+
+def range_digits(region_range):
+
+	"""
+	Total number of decimal digits written out for every value of a range,
+	counted per power-of-ten band rather than per value
+	"""
+
+	total = len(region_range)
+	band = 10
+	while len(region_range) and band <= region_range[-1]:
+		total += len(region_range) - count_below(region_range, band)
+		band *= 10
+	return total
+
+def region_bytes(region, count, silent_flag):
+
+	"""
+	Bytes one repeat count of a region adds to a record: label anchor plus sequence
+	"""
+
+	return (1 if silent_flag else 1 + len(region.unit)) + len(str(count)) + len(region.unit) * count
+
+def fixed_record_bytes(locus):
+
+	##
+	## Per record constants: label, flanks, intervening sequences, '\n' x 3
+	return len(locus.label.encode()) + len(locus.fiveprime) + len(locus.threeprime) + 3 + sum(len(region.intervening) for region in locus.regions)
+
+def max_record_bytes(locus, silent_flag=False):
+
+	"""
+	Size of a locus' largest possible record (every region at its highest count)
+	"""
+
+	return fixed_record_bytes(locus) + sum(region_bytes(region, region.range[-1], silent_flag) for region in locus.regions if len(region.range))
+
+def selected_bytes(locus, silent_flag, ordering, fixed_bytes):
+
+	"""
+	Output size of a locus' selected haplotypes; per record for samples, otherwise per
+	block of the pruned enumeration, the fastest region of each block in closed form
+	"""
+
+	regions = locus.regions
+	output_bytes = 0
+	if locus.sample is not None:
+		for range_tuple in selected_product(locus, ordering):
+			output_bytes += fixed_bytes + sum(region_bytes(region, count, silent_flag) for region, count in zip(regions, range_tuple))
+		return output_bytes
+
+	for counts, inner_position, values in selection_blocks(locus, ordering):
+		if inner_position is None:
+			output_bytes += fixed_bytes
+			continue
+		outer_bytes = sum(region_bytes(region, count, silent_flag) for position, (region, count) in enumerate(zip(regions, counts)) if position != inner_position)
+		unit = regions[inner_position].unit
+		anchor_bytes = 1 if silent_flag else 1 + len(unit)
+		output_bytes += len(values) * (fixed_bytes + outer_bytes + anchor_bytes) + range_digits(values) + len(unit) * range_sum(values)
+	return output_bytes
+
+def locus_plan(locus, silent_flag=False, ordering=DEFAULT_ORDERING):
+
+	"""
+	Closed form size of a locus' output, without enumerating any haplotypes
+	Every record is label + anchors, sequence, and separators; each term is additive over
+	repeat regions, so summing it over the product is sum_r (N / |range_r|) * sum(range_r)
+	Loci restricted to a subset of their product are sized over that subset (see selected_bytes)
+	"""
+
+	haplotypes = selection_size(locus)
+
+	fixed_bytes = fixed_record_bytes(locus)
+	output_bytes = fixed_bytes * haplotypes
+	if is_selective(locus):
+		output_bytes = selected_bytes(locus, silent_flag, locus.ordering or ordering, fixed_bytes)
+
+	##
+	## Per region terms: '_' [+ unit] + digits in the label, unit * count in the sequence
+	for region in locus.regions:
+		if not haplotypes:
+			break
+		region_range = region.range
+		if not is_selective(locus):
+			unit = region.unit
+			anchor_bytes = 1 if silent_flag else 1 + len(unit)
+			repeats = haplotypes // len(region_range)
+			output_bytes += repeats * (anchor_bytes * len(region_range) + range_digits(region_range) + len(unit) * range_sum(region_range))
+
+	return {'label': locus.label,
+			'haplotypes': haplotypes,
+			'bytes': output_bytes + 1,
+			'max_record_bytes': max_record_bytes(locus, silent_flag) if haplotypes else 0}
+
+def calibrate(locus, silent_flag, ordering):
+
+	"""
+	Times generation + encoding of a short run of records; returns seconds per output byte
+	"""
+
+	sample_bytes = 0
+	started = time.perf_counter()
+	for label, sequence in haplotype_records(locus, silent_flag, ordering, 0, CALIBRATION_RECORDS):
+		sample_bytes += len('{}\n{}\n\n'.format(label, sequence).encode())
+	elapsed = time.perf_counter() - started
+	return elapsed / sample_bytes if sample_bytes else 0.0
+
+def plan_loci(loci, silent_flag=False, ordering=DEFAULT_ORDERING, jobs=1):
+
+	"""
+	Plans a whole run: per locus sizes, totals, predicted peak memory and runtime
+	"""
+
+	plan = {'loci': [], 'haplotypes': 0, 'bytes': 0, 'max_record_bytes': 0}
+	largest_locus = None
+	for locus in loci:
+		current = locus_plan(locus, silent_flag, ordering)
+		plan['loci'].append(current)
+		plan['haplotypes'] += current['haplotypes']
+		plan['bytes'] += current['bytes']
+		plan['max_record_bytes'] = max(plan['max_record_bytes'], current['max_record_bytes'])
+		if largest_locus is None or current['bytes'] > largest_locus[1]:
+			largest_locus = (locus, current['bytes'])
+
+	##
+	## Memory: the interpreter as it stands, the output buffer and a handful of records
+	## (record, encoded copy, cached flank-side joins); plus the in-flight slices when parallel
+	## (parallel.py sizes slices with max_record_bytes, so its constants are imported here, not at the top)
+	baseline = peak_rss() or INTERPRETER_MEMORY
+	predicted_memory = baseline + WRITER_BUFFER + 4 * plan['max_record_bytes']
+	if jobs > 1 and plan['haplotypes']:
+		from .parallel import CHUNK_RECORDS, TARGET_SLICE_BYTES
+		average_record = plan['bytes'] / plan['haplotypes']
+		predicted_memory += jobs * baseline + 2 * jobs * 3 * min(average_record * CHUNK_RECORDS, TARGET_SLICE_BYTES)
+	plan['predicted_memory'] = int(predicted_memory)
+
+	##
+	## Runtime: calibrated throughput over the largest locus, assuming ideal scaling over jobs
+	seconds_per_byte = calibrate(largest_locus[0], silent_flag, ordering) if largest_locus else 0.0
+	plan['throughput'] = 1.0 / seconds_per_byte if seconds_per_byte else 0.0
+	plan['predicted_runtime'] = seconds_per_byte * plan['bytes'] / max(jobs, 1)
+	return plan
+
+def budget_violations(plan, max_records=None, max_bytes=None, max_memory=None, max_runtime=None):
+
+	"""
+	Returns a message for each configured budget the plan would exceed
+	"""
+
+	violations = []
+	if max_records is not None and plan['haplotypes'] > max_records:
+		violations.append('{} haplotypes exceeds the budget of {}'.format(plan['haplotypes'], max_records))
+	if max_bytes is not None and plan['bytes'] > max_bytes:
+		violations.append('{} of output exceeds the budget of {}'.format(format_size(plan['bytes']), format_size(max_bytes)))
+	if max_memory is not None and plan['predicted_memory'] > max_memory:
+		violations.append('{} predicted peak memory exceeds the budget of {}'.format(format_size(plan['predicted_memory']), format_size(max_memory)))
+	if max_runtime is not None and plan['predicted_runtime'] > max_runtime:
+		violations.append('{} predicted runtime exceeds the budget of {}'.format(format_duration(plan['predicted_runtime']), format_duration(max_runtime)))
+	return violations
+
+def plan_report(plan):
+
+	"""
+	Human readable (tab separated) report of a plan
+	"""
+
+	lines = ['#label\thaplotypes\tbytes\tmax_record_bytes']
+	for current in plan['loci']:
+		lines.append('{}\t{}\t{}\t{}'.format(current['label'].lstrip('>'), current['haplotypes'], current['bytes'], current['max_record_bytes']))
+	lines.append('')
+	lines.append('Loci:                  {}'.format(len(plan['loci'])))
+	lines.append('Haplotypes:            {}'.format(plan['haplotypes']))
+	lines.append('Output size:           {} ({} bytes, uncompressed)'.format(format_size(plan['bytes']), plan['bytes']))
+	lines.append('Largest record:        {}'.format(format_size(plan['max_record_bytes'])))
+	lines.append('Predicted peak memory: {}'.format(format_size(plan['predicted_memory'])))
+	lines.append('Predicted runtime:     {} (calibrated at {}/s)'.format(format_duration(plan['predicted_runtime']), format_size(plan['throughput'])))
+	return '\n'.join(lines)
@@ -0,0 +1,280 @@
+##
+## Haplotype subset selection
+## Constraints (a sequence length window, relations between regions) are linear in the repeat counts,
+## so the product is enumerated region by region, slowest first, with each region restricted to the
+## sub-range of counts that can still satisfy every constraint; infeasible branches are never visited.
+## The fastest region is reduced to a single sub-range per 'block', so counting and skipping is done a
+## block at a time. Random samples are drawn by index and decoded directly, never by filtering output.
+
+##
+## Generic imports
+import random
+from bisect import bisect_left
+
+##
+## Subpackage/s??
+from .ordering import DEFAULT_ORDERING, significance, product_size, count_below, unrank, rank, ordered_product
+
+##
+## count(first) - count(second) - offset must fall within these bounds (None: unbounded)
+RELATION_BOUNDS = {'lt': (None, -1), 'le': (None, 0), 'eq': (0, 0), 'ge': (0, None), 'gt': (1, None)}
+
+def is_selective(locus):
+
+	"""
+	True if only a subset of the locus' product is to be generated
+	"""
+
+	return bool(locus.constraints) or locus.min_length is not None or locus.max_length is not None or locus.sample is not None
+
+def is_constrained(locus):
+	return bool(locus.constraints) or locus.min_length is not None or locus.max_length is not None
+
+def linear_constraints(locus):
+
+	"""
+	Every constraint of a locus as (coefficients per region, low, high):
+	low <= sum(coefficient * count) <= high, either bound possibly None
+	"""
+
+	region_count = len(locus.regions)
+	linear = []
+
+	##
+	## Sequence length: flanks and intervening sequences are fixed, repeats contribute len(unit) * count
+	if locus.min_length is not None or locus.max_length is not None:
+		fixed = len(locus.fiveprime) + len(locus.threeprime) + sum(len(region.intervening) for region in locus.regions)
+		linear.append(([len(region.unit) for region in locus.regions],
+					   None if locus.min_length is None else locus.min_length - fixed,
+					   None if locus.max_length is None else locus.max_length - fixed))
+
+	##
+	## Region relations; an order refers to the first region carrying it
+	positions = {}
+	for position, region in enumerate(locus.regions):
+		positions.setdefault(region.order, position)
+	for constraint in locus.constraints:
+		coefficients = [0] * region_count
+		coefficients[positions[constraint.first]] += 1
+		coefficients[positions[constraint.second]] -= 1
+		low, high = RELATION_BOUNDS[constraint.relation]
+		linear.append((coefficients,
+					   None if low is None else low + constraint.offset,
+					   None if high is None else high + constraint.offset))
+	return linear
+
+def floor_div(numerator, denominator):
+	return numerator // denominator
+
+def ceil_div(numerator, denominator):
+	return -(-numerator // denominator)
+
+def selection_blocks(locus, ordering=DEFAULT_ORDERING):
+
+	"""
+	Pruned enumeration of a locus' constrained product, in the requested ordering
+	Yields (counts, inner_position, inner_values) blocks: every value of inner_values, placed at
+	inner_position of counts (the list is re-used between blocks), gives a valid haplotype.
+	A locus without repeat regions yields a single block of one empty haplotype (if valid)
+	"""
+
+	ranges = list(locus.ranges)
+	region_count = len(ranges)
+	linear = linear_constraints(locus)
+	if any(not len(region_range) for region_range in ranges):
+		return
+	if not region_count:
+		if all((low is None or low <= 0) and (high is None or high >= 0) for coefficients, low, high in linear):
+			yield [], None, (None,)
+		return
+
+	levels = significance(region_count, ordering)
+
+	##
+	## Extremes of the contribution of every region still unassigned below each depth
+	remaining_min = []
+	remaining_max = []
+	for coefficients, low, high in linear:
+		minimums = [0] * (region_count + 1)
+		maximums = [0] * (region_count + 1)
+		for depth in range(region_count - 1, -1, -1):
+			position = levels[depth]
+			ends = (coefficients[position] * ranges[position][0], coefficients[position] * ranges[position][-1])
+			minimums[depth] = minimums[depth+1] + min(ends)
+			maximums[depth] = maximums[depth+1] + max(ends)
+		remaining_min.append(minimums)
+		remaining_max.append(maximums)
+
+	def feasible(depth, sums):
+
+		##
+		## Counts of the region at depth which leave every constraint satisfiable
+		position = levels[depth]
+		region_range = ranges[position]
+		lowest, highest = region_range[0], region_range[-1]
+		for index, (coefficients, low, high) in enumerate(linear):
+			coefficient = coefficients[position]
+			low_bound = None if low is None else low - sums[index] - remaining_max[index][depth+1]
+			high_bound = None if high is None else high - sums[index] - remaining_min[index][depth+1]
+			if coefficient == 0:
+				if (low_bound is not None and low_bound > 0) or (high_bound is not None and high_bound < 0):
+					return range(0)
+				continue
+			##
+			## low_bound <= coefficient * count <= high_bound; dividing by a negative coefficient swaps the bounds
+			if coefficient < 0:
+				low_bound, high_bound = high_bound, low_bound
+			if low_bound is not None:
+				lowest = max(lowest, ceil_div(low_bound, coefficient))
+			if high_bound is not None:
+				highest = min(highest, floor_div(high_bound, coefficient))
+		return region_range[count_below(region_range, lowest):count_below(region_range, highest + 1)]
+
+	counts = [0] * region_count
+	inner_position = levels[-1]
+
+	def descend(depth, sums):
+		values = feasible(depth, sums)
+		if depth == region_count - 1:
+			if len(values):
+				yield counts, inner_position, values
+			return
+		position = levels[depth]
+		for value in values:
+			counts[position] = value
+			for block in descend(depth + 1, [total + coefficients[position] * value for total, (coefficients, low, high) in zip(sums, linear)]):
+				yield block
+
+	for block in descend(0, [0] * len(linear)):
+		yield block
+
+def block_tuples(counts, inner_position, values):
+
+	if inner_position is None:
+		yield ()
+		return
+	for value in values:
+		counts[inner_position] = value
+		yield tuple(counts)
+
+def constrained_size(locus):
+	return sum(len(values) for counts, inner_position, values in selection_blocks(locus))
+
+def constrained_product(locus, ordering=DEFAULT_ORDERING, start=0, stop=None):
+
+	"""
+	Slice [start, stop) of the constrained product; whole blocks before start are skipped uncounted
+	"""
+
+	offset = 0
+	for counts, inner_position, values in selection_blocks(locus, ordering):
+		if stop is not None and offset >= stop:
+			return
+		block_size = len(values)
+		if offset + block_size > start:
+			low = max(start - offset, 0)
+			high = block_size if stop is None else min(block_size, stop - offset)
+			for range_tuple in block_tuples(counts, inner_position, values[low:high]):
+				yield range_tuple
+		offset += block_size
+
+def sample_positions(locus, total):
+
+	"""
+	Seeded sample of (at most) locus.sample positions out of total, ascending
+	"""
+
+	rng = random.Random(locus.seed if locus.seed is not None else 0)
+	return sorted(rng.sample(range(total), min(locus.sample, total)))
+
+def sampled_product(locus, ordering=DEFAULT_ORDERING, start=0, stop=None):
+
+	"""
+	Slice [start, stop) of the sample; positions are decoded by unranking (unconstrained
+	product), or by walking the constrained blocks and picking the sampled positions out of them
+	"""
+
+	ranges = locus.ranges
+	if not is_constrained(locus):
+		positions = sample_positions(locus, product_size(ranges))[start:stop]
+		for index in positions:
+			yield tuple(region_range[position] for region_range, position in zip(ranges, unrank(ranges, index, ordering)))
+		return
+
+	positions = sample_positions(locus, constrained_size(locus))[start:stop]
+	position_index = 0
+	offset = 0
+	for counts, inner_position, values in selection_blocks(locus, ordering):
+		if position_index == len(positions):
+			return
+		block_size = len(values)
+		while position_index < len(positions) and positions[position_index] < offset + block_size:
+			value = values[positions[position_index] - offset]
+			if inner_position is None:
+				yield ()
+			else:
+				counts[inner_position] = value
+				yield tuple(counts)
+			position_index += 1
+		offset += block_size
+
+def selection_size(locus):
+
+	"""
+	Number of haplotypes a locus generates, after any constraints and sampling
+	"""
+
+	if not is_selective(locus):
+		return product_size(locus.ranges)
+	total = constrained_size(locus) if is_constrained(locus) else product_size(locus.ranges)
+	return total if locus.sample is None else min(locus.sample, total)
+
+def selected_product(locus, ordering=DEFAULT_ORDERING, start=0, stop=None):
+
+	"""
+	The locus' haplotypes (repeat count tuples), slice [start, stop) thereof, in the requested
+	ordering; a drop-in for ordering.ordered_product which honours the locus' selection
+	"""
+
+	if locus.sample is not None:
+		return sampled_product(locus, ordering, start, stop)
+	if is_constrained(locus):
+		return constrained_product(locus, ordering, start, stop)
+	return ordered_product(locus.ranges, ordering, start, stop)
+
+def selection_index(locus, counts, ordering=DEFAULT_ORDERING):
+
+	"""
+	Index of the haplotype with the given repeat counts within the locus' (selected) product
+	Raises ValueError if no such haplotype is generated for the locus
+	"""
+
+	counts = tuple(counts)
+	if len(counts) != len(locus.regions):
+		raise ValueError('Expected {} repeat count(s), got {}'.format(len(locus.regions), len(counts)))
+	positions = [region_range.index(count) for region_range, count in zip(locus.ranges, counts)]
+
+	if is_constrained(locus):
+		index = 0
+		for block_counts, inner_position, values in selection_blocks(locus, ordering):
+			if inner_position is None:
+				break
+			if all(block_counts[position] == count for position, count in enumerate(counts) if position != inner_position):
+				if counts[inner_position] not in values:
+					raise ValueError('Repeat counts {} do not satisfy the locus constraints'.format(counts))
+				index += values.index(counts[inner_position])
+				break
+			index += len(values)
+		else:
+			raise ValueError('Repeat counts {} do not satisfy the locus constraints'.format(counts))
+	else:
+		index = rank(locus.ranges, positions, ordering)
+
+	if locus.sample is None:
+		return index
+	total = constrained_size(locus) if is_constrained(locus) else product_size(locus.ranges)
+	positions = sample_positions(locus, total)
+	sample_index = bisect_left(positions, index)
+	if sample_index == len(positions) or positions[sample_index] != index:
+		raise ValueError('Repeat counts {} are not part of the locus sample'.format(counts))
+	return sample_index
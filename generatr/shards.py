@@ -0,0 +1,181 @@
+##
+## Sharded output
+## A reference too large for one FASTA is split into several, each made of disjoint slices of the loci's
+## ordered products; shards are generated independently (in parallel when jobs > 1) and the manifest maps
+## every haplotype label to its shard and offset. The shards, concatenated in order, are the unsharded output
+
+##
+## Generic imports
+import os
+
+##
+## Subpackage/s??
+from .output import FastaWriter
+from .haplotypes import haplotype_records
+from .planner import locus_plan
+from .ordering import DEFAULT_ORDERING
+
+##
+## Shards are balanced by haplotype count, by (uncompressed) size, or by size in whole loci
+SHARD_MODES = ('records', 'bytes', 'loci')
+COMPRESSED_SUFFIXES = ('.gz', '.bgz')
+
+def shard_paths(output_path, shard_count):
+
+	"""
+	panel.fa -> panel.001.fa, panel.002.fa ..; panel.fa.gz -> panel.001.fa.gz ..
+	Also returns the manifest path, panel.manifest.tsv
+	"""
+
+	root, compressed_suffix = output_path, ''
+	for suffix in COMPRESSED_SUFFIXES:
+		if root.endswith(suffix):
+			root, compressed_suffix = root[:-len(suffix)], suffix
+	root, extension = os.path.splitext(root)
+	width = max(3, len(str(shard_count)))
+	paths = ['{}.{}{}{}'.format(root, str(number).zfill(width), extension, compressed_suffix) for number in range(1, shard_count+1)]
+	return paths, root + '.manifest.tsv'
+
+def shard_bounds(locus_plans, shard_count, shard_by):
+
+	"""
+	Shard boundaries as global haplotype indices (over every locus, in output order)
+	Byte boundaries within a locus are placed from its mean record size, so are approximate
+	"""
+
+	total_records = sum(current['haplotypes'] for current in locus_plans)
+	if shard_by == 'records':
+		return [total_records * number // shard_count for number in range(shard_count + 1)]
+	if shard_by not in SHARD_MODES:
+		raise ValueError('Unknown shard mode: {}'.format(shard_by))
+
+	total_bytes = sum(current['bytes'] for current in locus_plans)
+	bounds = [0]
+	locus_records = 0
+	locus_bytes = 0
+	current_locus = iter(locus_plans)
+	current = next(current_locus, None)
+	for number in range(1, shard_count):
+		target = total_bytes * number / shard_count
+
+		##
+		## Move on to the locus in which the target size falls
+		while current is not None and locus_bytes + current['bytes'] <= target:
+			locus_records += current['haplotypes']
+			locus_bytes += current['bytes']
+			current = next(current_locus, None)
+		if current is None:
+			bounds.append(total_records)
+		elif shard_by == 'loci':
+
+			##
+			## Whichever end of the locus is nearer the target (its start, when the target is a locus boundary)
+			nearer_start = target - locus_bytes <= locus_bytes + current['bytes'] - target
+			bounds.append(locus_records + (0 if nearer_start else current['haplotypes']))
+		else:
+			mean_record = (current['bytes'] - 1) / current['haplotypes'] if current['haplotypes'] else 1
+			bounds.append(locus_records + min(current['haplotypes'], int(round((target - locus_bytes) / mean_record))))
+	bounds.append(total_records)
+
+	##
+	## Whole-locus boundaries can run ahead of later targets; keep them ascending
+	for number in range(1, len(bounds)):
+		bounds[number] = max(bounds[number], bounds[number-1])
+	return bounds
+
+def shard_slices(loci, shard_count, shard_by='records', silent_flag=False, ordering=DEFAULT_ORDERING):
+
+	"""
+	Splits loci into at most shard_count shards
+	Returns a list (per non-empty shard) of (locus, start, stop, final_slice) slices; final_slice
+	marks the slice holding a locus' last record, after which the locus is terminated
+	"""
+
+	loci = list(loci)
+	locus_plans = [locus_plan(locus, silent_flag, ordering) for locus in loci]
+	bounds = shard_bounds(locus_plans, max(1, shard_count), shard_by)
+	last_shard = len(bounds) - 2
+	shards = [[] for number in range(last_shard + 1)]
+
+	shard = 0
+	locus_start = 0
+	for locus, current in zip(loci, locus_plans):
+		haplotypes = current['haplotypes']
+		start = 0
+		while True:
+			while shard < last_shard and bounds[shard+1] <= locus_start + start and start < haplotypes:
+				shard += 1
+			stop = min(haplotypes, bounds[shard+1] - locus_start) if shard < last_shard else haplotypes
+			shards[shard].append((locus, start, stop, stop == haplotypes))
+			if stop == haplotypes:
+				break
+			start = stop
+		locus_start += haplotypes
+
+	return [slices for slices in shards if slices]
+
+def write_shard(shard_path, manifest_path, slices, silent_flag, ordering, compress, index):
+
+	"""
+	Generates one shard from its slices, with its part of the manifest (label, shard, offset)
+	Offsets are of the record within the uncompressed shard. Returns (records, bytes) written
+	"""
+
+	shard_name = os.path.basename(shard_path)
+	with FastaWriter(shard_path, compress, index) as writer, open(manifest_path, 'w') as manifest_file:
+		for locus, start, stop, final_slice in slices:
+			for label, sequence in haplotype_records(locus, silent_flag, ordering, start, stop):
+				manifest_file.write('{}\t{}\t{}\n'.format(label.lstrip('>'), shard_name, writer.bytes_written))
+				writer.write_record(label, sequence)
+			if final_slice:
+				writer.end_locus()
+	return writer.records_written, writer.bytes_written
+
+def write_shards(loci, output_path, shard_count, shard_by, jobs, silent_flag, ordering, compress=False, index=False, on_shard=None):
+
+	"""
+	Writes loci as shards of output_path plus the manifest, across a process pool when jobs > 1
+	The manifest is written (atomically) last, once every shard is in place
+	on_shard(records, bytes) is called as each shard is collected, in shard order
+	"""
+
+	shards = shard_slices(loci, shard_count, shard_by, silent_flag, ordering)
+	paths, manifest_path = shard_paths(output_path, len(shards))
+	manifest_parts = ['{}.{}.part'.format(manifest_path, number) for number in range(len(shards))]
+	tasks = [(path, part, slices, silent_flag, ordering, compress, index) for path, part, slices in zip(paths, manifest_parts, shards)]
+
+	try:
+		if jobs > 1 and len(tasks) > 1:
+			from concurrent.futures import ProcessPoolExecutor
+			with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+				futures = [executor.submit(write_shard, *task) for task in tasks]
+				written = []
+				for future in futures:
+					written.append(future.result())
+					if on_shard is not None:
+						on_shard(*written[-1])
+		else:
+			written = []
+			for task in tasks:
+				written.append(write_shard(*task))
+				if on_shard is not None:
+					on_shard(*written[-1])
+
+		##
+		## Manifest parts are concatenated in shard order
+		with open(manifest_path + '.part', 'w') as manifest_file:
+			manifest_file.write('#label\tshard\toffset\n')
+			for part in manifest_parts:
+				with open(part, 'r') as part_file:
+					for line in part_file:
+						manifest_file.write(line)
+		os.replace(manifest_path + '.part', manifest_path)
+	finally:
+		for part in manifest_parts + [manifest_path + '.part']:
+			if os.path.exists(part):
+				os.remove(part)
+
+	return {'records': sum(records for records, size in written),
+			'bytes': sum(size for records, size in written),
+			'shards': paths,
+			'manifest': manifest_path}
@@ -30,6 +30,7 @@ setup(
 									'logs'
 									]),
     install_requires=['lxml'],
+    extras_require={'yaml': ['PyYAML']},
     package_data={'': ['dtdvalidate/example_input.xml',
 					   'dtdvalidate/xml_rules.dtd']},
 	include_package_data=True,
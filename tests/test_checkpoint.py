@@ -0,0 +1,117 @@
+##
+## Checkpointed output, resumed
+## A run is stopped part way, its '.part' output damaged (cut short, or altered) inside a locus, then resumed;
+## the finished output must be byte-identical to an uninterrupted run
+
+##
+## Generic imports
+import os
+import pytest
+
+##
+## Subpackage/s??
+from generatr import checkpoint
+from generatr.api import Generator
+from generatr.metrics import RunMetrics
+from generatr.model import Locus, Region, Constraint
+from generatr.checkpoint import CheckpointJournal, RunInterrupted
+
+LOCI = [Locus('HTT', 'GCGACCCTGG', 'CCTCCTCAGC', [Region('CAG', 1, 30, 1, 'CAACAGCCGCCA'), Region('CCG', 1, 12, 2)]),
+		Locus('ATXN', 'TTTT', 'CCCC', [Region('AT', 1, 9, 1), Region('GGC', 2, 40, 2)], constraints=[Constraint(2, 'ge', 1)])]
+
+class StoppingJournal(CheckpointJournal):
+
+	##
+	## Asks to stop once a number of checkpoints have been taken, as SIGTERM would
+	def __init__(self, output_path, stop_after, **options):
+		super(StoppingJournal, self).__init__(output_path, interval=0, **options)
+		self.stop_after = stop_after
+
+	def checkpoint(self, writer, locus):
+		super(StoppingJournal, self).checkpoint(writer, locus)
+		self.stop_after -= 1
+		if not self.stop_after:
+			self.request_stop()
+
+@pytest.fixture
+def reference(tmp_path):
+
+	reference_path = str(tmp_path / 'reference.fa')
+	Generator().write_output(LOCI, reference_path)
+	with open(reference_path, 'rb') as reference_file:
+		return reference_file.read()
+
+def interrupted_run(output_path, stop_after):
+
+	with pytest.raises(RunInterrupted):
+		Generator().write_output(LOCI, output_path, journal=StoppingJournal(output_path, stop_after))
+	assert os.path.exists(output_path + '.part') and os.path.exists(output_path + '.journal')
+	return CheckpointJournal(output_path).load()
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+
+	##
+	## Checkpoints every few records, so small loci get several (mid-locus) checkpoints
+	monkeypatch.setattr(checkpoint, 'CHECKPOINT_RECORDS', 7)
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_resume_after_truncation_mid_locus(tmp_path, reference, jobs):
+
+	output_path = str(tmp_path / 'panel.fa')
+	checkpoints = interrupted_run(output_path, stop_after=30)
+
+	##
+	## Cut the output between two checkpoints within the first locus
+	within_locus = [entry for entry in checkpoints if entry['locus'] == 0 and entry['position']]
+	assert len(within_locus) > 2
+	cut = (within_locus[1]['bytes'] + within_locus[2]['bytes']) // 2
+	with open(output_path + '.part', 'r+b') as partial_file:
+		partial_file.truncate(cut)
+
+	journal = CheckpointJournal(output_path, resume=True)
+	Generator(jobs=jobs).write_output(LOCI, output_path, journal=journal)
+	assert journal.resumed == within_locus[1]
+	with open(output_path, 'rb') as output_file:
+		assert output_file.read() == reference
+	assert not os.path.exists(output_path + '.part') and not os.path.exists(output_path + '.journal')
+
+def test_resume_after_corruption(tmp_path, reference):
+
+	output_path = str(tmp_path / 'panel.fa')
+	checkpoints = interrupted_run(output_path, stop_after=65)
+	assert checkpoints[-1]['locus'] == 1
+
+	##
+	## A byte altered in the fourth checkpointed segment; resuming falls back to the third checkpoint
+	with open(output_path + '.part', 'r+b') as partial_file:
+		partial_file.seek(checkpoints[3]['bytes'] - 2)
+		partial_file.write(b'N')
+
+	journal = CheckpointJournal(output_path, resume=True)
+	Generator().write_output(LOCI, output_path, journal=journal)
+	assert journal.resumed == checkpoints[2]
+	with open(output_path, 'rb') as output_file:
+		assert output_file.read() == reference
+
+def test_resumed_output_is_not_throughput(tmp_path, reference):
+
+	##
+	## Output already on disk counts towards progress, but not towards this run's rate
+	output_path = str(tmp_path / 'panel.fa')
+	interrupted_run(output_path, stop_after=65)
+	journal = CheckpointJournal(output_path, resume=True)
+	metrics = RunMetrics(per_locus=False)
+	Generator().write_output(LOCI, output_path, metrics=metrics, journal=journal)
+	report = metrics.report()
+	assert (report['resumed_records'], report['resumed_bytes']) == (journal.resumed['records'], journal.resumed['bytes'])
+	assert report['bytes'] == len(reference) > report['resumed_bytes'] > 0
+	assert report['bytes_per_second'] * report['elapsed'] == pytest.approx(report['bytes'] - report['resumed_bytes'])
+
+def test_resume_refuses_a_changed_config(tmp_path):
+
+	output_path = str(tmp_path / 'panel.fa')
+	interrupted_run(output_path, stop_after=65)
+	changed = [LOCI[0], Locus('ATXN', 'TTTT', 'CCCC', [Region('AT', 1, 9, 1), Region('GGC', 2, 41, 2)])]
+	with pytest.raises(checkpoint.CheckpointError):
+		Generator().write_output(changed, output_path, journal=CheckpointJournal(output_path, resume=True))
@@ -0,0 +1,52 @@
+##
+## Compact config formats
+## Records of the wrong shape or type must come back as per-locus validation reports (ConfigError),
+## never a traceback out of the ruleset; JSON arrays are streamed, and must be well formed
+
+##
+## Generic imports
+import json
+import pytest
+
+##
+## Subpackage/s??
+from generatr.api import package_data
+from generatr.dtdvalidate import loaders
+from generatr.dtdvalidate.validation import ConfigReader, ConfigError
+
+LOCUS = {'label': 'HTT', 'fiveprime': 'GCGACCCTGG', 'threeprime': 'CCTCCTCAGC',
+		 'regions': [{'unit': 'CAG', 'start': 1, 'end': 30}, {'unit': 'CCG', 'start': 1, 'end': 12}]}
+
+def read_loci(config_path, validate=True):
+	return list(ConfigReader(package_data('dtdvalidate/xml_rules.dtd'), str(config_path), stream=True, validate=validate).iter_loci())
+
+@pytest.mark.parametrize('validate', (True, False))
+@pytest.mark.parametrize('flank', ('fiveprime', 'threeprime'))
+def test_non_text_flank_is_reported(tmp_path, caplog, flank, validate):
+
+	config_path = tmp_path / 'loci.json'
+	config_path.write_text(json.dumps([LOCUS, dict(LOCUS, label='BAD', **{flank: 123})]))
+	with pytest.raises(ConfigError):
+		read_loci(config_path, validate)
+	if validate:
+		assert 'Invalid int value in {}, expecting text'.format(flank) in caplog.text
+
+@pytest.mark.parametrize('chunk', (3, 64*1024))
+def test_json_array_is_streamed(tmp_path, monkeypatch, chunk):
+
+	monkeypatch.setattr(loaders, 'JSON_CHUNK', chunk)
+	config_path = tmp_path / 'loci.json'
+	config_path.write_text(' [ {} ,\n{} ] '.format(json.dumps(LOCUS), json.dumps(dict(LOCUS, label='ATXN'))))
+	assert [raw_locus['@label'] for raw_locus in read_loci(config_path)] == ['HTT', 'ATXN']
+
+@pytest.mark.parametrize('chunk', (3, 64*1024))
+@pytest.mark.parametrize('layout', ('[{0} {1}]', '[,{0},{1}]', '[{0},,{1}]', '[{0}, ,{1}]', '[{0},{1},]'))
+def test_json_array_separators(tmp_path, monkeypatch, chunk, layout):
+
+	##
+	## Exactly one ',' between elements, none before the first or after the last
+	monkeypatch.setattr(loaders, 'JSON_CHUNK', chunk)
+	config_path = tmp_path / 'loci.json'
+	config_path.write_text(layout.format(json.dumps(LOCUS), json.dumps(dict(LOCUS, label='ATXN'))))
+	with pytest.raises(ConfigError, match='Unreadable config'):
+		read_loci(config_path)
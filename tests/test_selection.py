@@ -0,0 +1,84 @@
+##
+## Subset selection against brute force
+## Random loci (fixed seeds) with steps, constraints, length windows and samples; the pruned enumeration in
+## selection.py must give exactly the haplotypes a plain filter over the full ordered product keeps, in the
+## same order, for every slice, with matching sizes and indices
+
+##
+## Generic imports
+import random
+import operator
+import pytest
+
+##
+## Subpackage/s??
+from generatr.model import Locus, Region, Constraint
+from generatr.ordering import ORDERINGS, ordered_product
+from generatr.selection import selected_product, selection_size, selection_index
+
+RELATION_OPERATORS = {'lt': operator.lt, 'le': operator.le, 'eq': operator.eq, 'ge': operator.ge, 'gt': operator.gt}
+TRIALS = 400
+
+def random_locus(rng, sample=None):
+
+	regions = []
+	for order in range(1, rng.randint(0, 3) + 1):
+		start = rng.randint(0, 5)
+		regions.append(Region(rng.choice(('A', 'CAG', 'GC')), start, start + rng.randint(-1, 7), order, 'T' * rng.randint(0, 2), rng.randint(1, 3)))
+	constraints = []
+	for _ in range(rng.randint(0, 2) if regions else 0):
+		constraints.append(Constraint(rng.randint(1, len(regions)), rng.choice(sorted(RELATION_OPERATORS)), rng.randint(1, len(regions)), rng.randint(-3, 3)))
+	min_length = rng.choice((None, rng.randint(0, 30)))
+	max_length = rng.choice((None, rng.randint(0, 40)))
+	return Locus('x', 'AA', 'C', regions, None, constraints, min_length, max_length, sample, 3 if sample else None)
+
+def brute_force(locus, ordering):
+
+	"""
+	Every haplotype of the full ordered product which satisfies the locus' constraints and length window
+	"""
+
+	orders = [region.order for region in locus.regions]
+	kept = []
+	for counts in ordered_product(locus.ranges, ordering):
+		count_of = dict(zip(orders, counts))
+		length = len(locus.fiveprime) + len(locus.threeprime)
+		length += sum(count * len(region.unit) + len(region.intervening) for count, region in zip(counts, locus.regions))
+		if locus.min_length is not None and length < locus.min_length:
+			continue
+		if locus.max_length is not None and length > locus.max_length:
+			continue
+		if all(RELATION_OPERATORS[constraint.relation](count_of[constraint.first], count_of[constraint.second] + constraint.offset)
+			   for constraint in locus.constraints):
+			kept.append(counts)
+	return kept
+
+@pytest.mark.parametrize('ordering', ORDERINGS)
+def test_selection_matches_brute_force(ordering):
+
+	rng = random.Random(ORDERINGS.index(ordering))
+	for _ in range(TRIALS):
+		locus = random_locus(rng)
+		expected = brute_force(locus, ordering)
+		assert list(selected_product(locus, ordering)) == expected
+		assert selection_size(locus) == len(expected)
+
+		start, stop = sorted(rng.randint(0, len(expected) + 2) for _ in range(2))
+		assert list(selected_product(locus, ordering, start, stop)) == expected[start:stop]
+		for index, counts in enumerate(expected):
+			assert selection_index(locus, counts, ordering) == index
+
+@pytest.mark.parametrize('ordering', ORDERINGS)
+def test_sample_is_an_ordered_subset(ordering):
+
+	rng = random.Random(10 + ORDERINGS.index(ordering))
+	for _ in range(TRIALS):
+		locus = random_locus(rng, sample=rng.randint(1, 10))
+		expected = brute_force(locus, ordering)
+		sampled = list(selected_product(locus, ordering))
+		assert len(sampled) == min(locus.sample, len(expected)) == selection_size(locus)
+		assert sampled == sorted(sampled, key=expected.index)
+		assert list(selected_product(locus, ordering, 1, 3)) == sampled[1:3]
+		assert list(selected_product(locus, ordering)) == sampled
+		for index, counts in enumerate(sampled):
+			assert selection_index(locus, counts, ordering) == index
@@ -0,0 +1,52 @@
+##
+## Shard boundaries
+## Shards split by whole loci must fall on locus boundaries and balance sizes; sharded output, concatenated,
+## must be the unsharded output
+
+##
+## Generic imports
+import pytest
+
+##
+## Subpackage/s??
+from generatr.api import Generator
+from generatr.model import Locus, Region
+from generatr.shards import shard_bounds, shard_slices
+
+def equal_plans(count, haplotypes=4, size=100):
+	return [{'haplotypes': haplotypes, 'bytes': size} for _ in range(count)]
+
+@pytest.mark.parametrize('shard_count', range(1, 11))
+def test_whole_loci_of_equal_size(shard_count):
+
+	##
+	## Ten equal loci: every shard holds floor or ceiling of 10/shard_count loci, and none is lost
+	bounds = shard_bounds(equal_plans(10), shard_count, 'loci')
+	assert bounds[0] == 0 and bounds[-1] == 40 and len(bounds) == shard_count + 1
+	loci_per_shard = [(stop - start) // 4 for start, stop in zip(bounds, bounds[1:])]
+	assert all(bound % 4 == 0 for bound in bounds)
+	assert sorted(loci_per_shard) == sorted(10 * (number+1) // shard_count - 10 * number // shard_count for number in range(shard_count))
+
+def test_whole_loci_nearest_boundary():
+
+	##
+	## Targets 125, 250 and 375 bytes in: past most of the first locus, half way through the second (its start
+	## is taken), and a quarter of the way into the third
+	plans = [{'haplotypes': 4, 'bytes': 200}, {'haplotypes': 2, 'bytes': 100}, {'haplotypes': 4, 'bytes': 200}]
+	assert shard_bounds(plans, 2, 'loci') == [0, 4, 10]
+	assert shard_bounds(plans, 4, 'loci') == [0, 4, 4, 6, 10]
+
+def test_shards_concatenate_to_output(tmp_path):
+
+	loci = [Locus('L{}'.format(number), 'ACGT', 'TTGA', [Region('CAG', 1, 12, 1)]) for number in range(10)]
+	reference_path = str(tmp_path / 'panel.fa')
+	Generator().write_output(loci, reference_path)
+	written = Generator().write_output(loci, str(tmp_path / 'sharded.fa'), shards=5, shard_by='loci')
+	assert len(written['shards']) == 5 == len(shard_slices(loci, 5, 'loci'))
+	with open(reference_path, 'rb') as reference_file:
+		reference = reference_file.read()
+	concatenated = b''
+	for shard_path in written['shards']:
+		with open(shard_path, 'rb') as shard_file:
+			concatenated += shard_file.read()
+	assert concatenated == reference